@@ -0,0 +1,167 @@
+"""
+
+imgwriter / asyncapi.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+from main import Writer, Reader, probe
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from threading import Event
+from weakref import WeakKeyDictionary
+import asyncio
+import inspect
+import io
+import os
+
+
+def _isAsyncStream(payload) -> bool:
+    return inspect.iscoroutinefunction(getattr(payload, "read", None)) or hasattr(payload, "__aiter__")
+
+async def _readAsyncChunk(payload, size: int) -> bytes:
+    """ Returns the next piece of an async stream, empty at the end """
+    if hasattr(payload, "__aiter__") and not inspect.iscoroutinefunction(getattr(payload, "read", None)):
+        try: return await payload.__aiter__().__anext__()
+        except StopAsyncIteration: return b""
+    return await payload.read(size)
+
+
+class _StreamBridge(io.RawIOBase):
+    def __init__(self, stream, loop: asyncio.AbstractEventLoop) -> None:
+        """ Blocking file-like view of an async byte stream, read from a worker thread while the event loop runs """
+        self.__stream, self.__loop = stream, loop
+        self.__buffer = b""
+
+    def readable(self) -> bool:
+        return True
+
+    def readinto(self, buffer) -> int:
+        # the worker thread waits for the event loop, which is how a slow stream slows the writing down
+        if len(self.__buffer) == 0:
+            self.__buffer = asyncio.run_coroutine_threadsafe(_readAsyncChunk(self.__stream, len(buffer)), self.__loop).result()
+        length = min(len(buffer), len(self.__buffer))
+        buffer[:length] = self.__buffer[:length]
+        self.__buffer = self.__buffer[length:]
+        return length
+
+
+def _cancellableProgress(options: dict, cancelEvent: Event):
+    """ Returns a progress callback that also stops the job when the call was cancelled, options can contain the progress of the caller """
+    progress = options.pop("progress", None)
+    if cancelEvent is None: return progress
+    def report(processedLength: int, totalLength: int) -> bool:
+        if cancelEvent.is_set(): return False
+        return progress is None or progress(processedLength, totalLength) != False
+    return report
+
+def _writeJob(image, payload, dataType: str, path, profile: str, addExif: bool, options: dict, cancelEvent: Event):
+    progress = _cancellableProgress(options, cancelEvent)
+    writer = Writer(image, payload, dataType, progress=progress, **options)
+    if path is None: return writer.image
+    writer.save(path, addExif, profile)
+    return None
+
+def _readJob(image, output, member: str, options: dict, cancelEvent: Event):
+    progress = _cancellableProgress(options, cancelEvent)
+    if member is None: return Reader(image, output=output, progress=progress, **options).payloadBinary
+    return Reader(image, readPayload=False, progress=progress, **options).readMember(member, output)
+
+def _probeJob(image, cancelEvent: Event) -> dict:
+    return probe(image)
+
+
+class AsyncRunner:
+    def __init__(self, executor: Executor = None, limit: int = None) -> None:
+        """
+        Runs reading and writing on an executor so that the event loop is not blocked
+        param executor can be a ThreadPoolExecutor or a ProcessPoolExecutor, by default a thread pool of limit threads is created
+        Pillow and the codecs release the GIL for the heavy parts, a process pool is faster for many large images at once
+        param limit is the maximum number of jobs running at once, by default the number of processors
+        further calls wait until a job finishes, so a busy runner slows its callers down instead of queueing without limit
+        """
+        self.__limit = (os.cpu_count() or 1) if limit is None else limit
+        if type(self.__limit) is not int or self.__limit < 1:
+            raise ValueError(f"Parameter limit should be a positive integer, but {limit!r} was given")
+        self.__ownsExecutor = executor is None
+        self.__executor = ThreadPoolExecutor(max_workers=self.__limit) if executor is None else executor
+        self.__usesProcesses = isinstance(self.__executor, ProcessPoolExecutor)
+        self.__semaphores = WeakKeyDictionary()     # by event loop
+
+    async def __aenter__(self) -> "AsyncRunner":
+        return self
+
+    async def __aexit__(self, errorType, error, traceback) -> None:
+        self.close()
+
+    def close(self) -> None:
+        """ Shuts down the executor if it was created by the runner """
+        if self.__ownsExecutor: self.__executor.shutdown(wait=False, cancel_futures=True)
+
+    async def __run(self, job, *arguments):
+        """ Runs the job in the executor when there is room for it, a cancelled call also cancels a job running in a thread """
+        # every event loop has its own semaphore, as it cannot be shared between them
+        loop = asyncio.get_running_loop()
+        if loop not in self.__semaphores: self.__semaphores[loop] = asyncio.Semaphore(self.__limit)
+        async with self.__semaphores[loop]:
+            cancelEvent = None if self.__usesProcesses else Event()
+            future = loop.run_in_executor(self.__executor, job, *arguments, cancelEvent)
+            try:
+                return await asyncio.shield(future)
+            except asyncio.CancelledError:
+                # the job stops at its next progress report, the slot is freed when it has stopped
+                if cancelEvent is not None: cancelEvent.set()
+                try: await future
+                except Exception: pass
+                raise
+
+    async def write(self, image, payload, dataType: str, path = None, profile: str = "default", addExif: bool = False, **options):
+        """
+        Same as Writer followed by Writer.save, see Writer for the parameters in options
+        a progress callback in options is called in the worker thread, it cannot be used with processes
+        param payload can also be an async byte stream, such as asyncio.StreamReader or an async iterable of bytes
+        it is then streamed with threads and read into memory first with processes
+        param path is where to save the image, with None the modified image is returned instead
+        """
+        if _isAsyncStream(payload):
+            if self.__usesProcesses:
+                chunks = []
+                while len(chunk := await _readAsyncChunk(payload, 1024*1024)) > 0: chunks.append(chunk)
+                payload = b"".join(chunks)
+            else: payload = _StreamBridge(payload, asyncio.get_running_loop())
+        return await self.__run(_writeJob, image, payload, dataType, path, profile, addExif, options)
+
+    async def read(self, image, output = None, member: str = None, **options):
+        """
+        Same as Reader, see Reader for the parameters in options
+        Returns the payload, or the member of a container if member is given, or None if output was given
+        """
+        return await self.__run(_readJob, image, output, member, options)
+
+    async def probe(self, image) -> dict:
+        """ Same as main.probe """
+        return await self.__run(_probeJob, image)
+
+
+# runner of the module level functions, created on first use
+_defaultRunner = None
+
+def _runner(runner: AsyncRunner) -> AsyncRunner:
+    global _defaultRunner
+    if runner is not None: return runner
+    if _defaultRunner is None: _defaultRunner = AsyncRunner()
+    return _defaultRunner
+
+async def writeAsync(image, payload, dataType: str, path = None, runner: AsyncRunner = None, **options):
+    """ Writes the payload with AsyncRunner.write, by default on a shared thread pool """
+    return await _runner(runner).write(image, payload, dataType, path, **options)
+
+async def readAsync(image, output = None, member: str = None, runner: AsyncRunner = None, **options):
+    """ Reads the payload with AsyncRunner.read, by default on a shared thread pool """
+    return await _runner(runner).read(image, output, member, **options)
+
+async def probeAsync(image, runner: AsyncRunner = None) -> dict:
+    """ Reads only the header with AsyncRunner.probe, by default on a shared thread pool """
+    return await _runner(runner).probe(image)
@@ -0,0 +1,163 @@
+"""
+
+imgwriter / batch.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+import main
+from main import Reader, Writer
+from filenames import extractFileExtension, addFileNameComponent, hasFileNameComponent
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import glob
+import json
+import os
+from base64 import b64encode
+from pathlib import Path
+
+
+def runJob(job: dict) -> dict:
+    """
+    Performs one job and returns its result in the format of the machine readable mode of cli.py
+    The job is a dict with key image and one of the following
+    text or file (with optional out, dataType, compression, density and exif) to write, out or outDir to read to file, print to read or info to probe
+    """
+    result = {"image": job.get("image")}
+    try:
+        if "text" in job or "file" in job:
+            result.update(_runWrite(job))
+        elif job.get("info") == True:
+            result.update({"success": True, **main.probe(job["image"])})
+        elif job.get("print") == True:
+            result.update(_runPrint(job))
+        elif "out" in job or "outDir" in job:
+            result.update(_runRead(job))
+        else:
+            raise ValueError("Job has neither read nor write options")
+    except FileNotFoundError as e:
+        result.update({"error": 2, "description": f"File '{e.filename}' not found"})
+    except Exception as e:
+        result.update({"error": 3, "description": str(e)})
+    return result
+
+def _runWrite(job: dict) -> dict:
+    if "text" in job: payload, dataType = str(job["text"]).encode("utf-8"), job.get("dataType", "txt")
+    else: payload, dataType = Path(job["file"]), job.get("dataType")
+    writer = Writer(job["image"], payload, dataType, compression=job.get("compression"), density=job.get("density", "standard"))
+    writer.save(job["out"], job.get("exif") == True)
+    return {"success": True, "path": os.path.abspath(job["out"])}
+
+def _runPrint(job: dict) -> dict:
+    payload = Reader(job["image"]).payloadBinary
+    try: return {"success": True, "payload": payload.decode("utf-8")}
+    except UnicodeDecodeError: return {"success": True, "payload": b64encode(payload).decode("utf-8"), "base64": True}
+
+def _runRead(job: dict) -> dict:
+    output = job.get("out")
+    if output is None:
+        # name the file after the image and the stored data type
+        reader = Reader(job["image"], readPayload=False)
+        output = os.path.join(job["outDir"], os.path.splitext(os.path.split(job["image"])[1])[0])
+        if reader.dataType != "": output += "." + reader.dataType
+    Reader(job["image"], output=output)
+    return {"success": True, "path": os.path.abspath(output)}
+
+
+class BatchApp:
+    def __init__(self, arguments: list = None) -> None:
+        self.__parseArguments(arguments)
+        jobs = self.__collectJobs()
+        failed = self.__runJobs(jobs)
+        exit(3 if failed else 0)
+
+    def __parseArguments(self, arguments: list) -> None:
+        desc = os.linesep.join([
+            "Process many images in parallel and print one JSON result line per job",
+            "The source is a directory, a glob pattern or a JSONL manifest with one job per line, for example",
+            '{"image": "a.png", "file": "doc.pdf", "out": "a.data.png"} or {"image": "a.data.png", "out": "doc.pdf"}'
+        ])
+        parser = argparse.ArgumentParser(prog="cli.py batch", description=desc, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+        parser.add_argument("source", help="Directory, glob pattern or JSONL manifest (.jsonl)")
+        parser.add_argument("-j", metavar="WORKERS", type=int, default=os.cpu_count(), help="Number of worker processes")
+        parser.add_argument("-e", action="store_true", help="Add imgwriter to images' exif data (with -t and -f)")
+        parser.add_argument("-c", metavar="CODEC", choices=["none", "zlib", "bz2", "lzma", "auto"], help="Compress the stored data with none, zlib, bz2, lzma or auto (with -t and -f)")
+        parser.add_argument("-d", metavar="DENSITY", choices=["standard", "rgb16", "rgba16"], help="Store more data per pixel with rgb16 or rgba16 (with -t and -f)")
+
+        # what to do with every image of a directory or glob pattern
+        modeGroup = parser.add_mutually_exclusive_group()
+        modeGroup.add_argument("-t", metavar="TEXT", help="Store text inside every image")
+        modeGroup.add_argument("-f", metavar="PATH", help="Store contents of file inside every image")
+        modeGroup.add_argument("-p", action="store_true", help="Read the content of every image into the results")
+        modeGroup.add_argument("-o", metavar="DIR", help="Save the content of every image to files in directory")
+        modeGroup.add_argument("--info", action="store_true", help="Read only information about the content of every image")
+
+        self.__args = vars(parser.parse_args(arguments))
+        if self.__args["j"] < 1:
+            parser.error("there must be at least one worker")
+
+    def __completeJob(self, job: dict) -> dict:
+        """ Fills in the default output path and data type of a write job """
+        if not isinstance(job, dict) or type(job.get("image")) is not str:
+            raise ValueError("Job should be an object with an image path")
+        job = dict(job)
+        if "text" in job or "file" in job:
+            job.setdefault("out", addFileNameComponent(job["image"], "data"))
+            if "file" in job: job.setdefault("dataType", extractFileExtension(job["file"]))
+            if self.__args["e"] == True: job.setdefault("exif", True)
+            if self.__args["c"] is not None: job.setdefault("compression", self.__args["c"])
+            if self.__args["d"] is not None: job.setdefault("density", self.__args["d"])
+        return job
+
+    def __collectJobs(self) -> list:
+        """ Returns a list of jobs, or of error results for manifest lines that could not be parsed """
+        source = self.__args["source"]
+        if source.lower().endswith(".jsonl") and os.path.isfile(source):
+            jobs = []
+            with open(source, "r", encoding="utf-8") as file:
+                for lineNumber, line in enumerate(file, 1):
+                    if line.strip() == "": continue
+                    try: jobs.append(self.__completeJob(json.loads(line)))
+                    except ValueError as e: jobs.append({"error": 1, "description": f"Line {lineNumber}: {e}"})
+            return jobs
+
+        # the same job for every image
+        if os.path.isdir(source):
+            images = [entry.path for entry in os.scandir(source) if entry.is_file()]
+        else:
+            images = glob.glob(source, recursive=True)
+        # the images written by earlier runs into the same directory are not carriers to process again
+        images = [image for image in images if not hasFileNameComponent(image, "data")]
+        if self.__args["t"] is not None: template = {"text": self.__args["t"]}
+        elif self.__args["f"] is not None: template = {"file": self.__args["f"]}
+        elif self.__args["p"] == True: template = {"print": True}
+        elif self.__args["o"] is not None: template = {"outDir": self.__args["o"]}
+        elif self.__args["info"] == True: template = {"info": True}
+        else:
+            print(json.dumps({"error": 1, "description": "Neither read nor write options provided. Pass -t, -f, -p, -o or --info."}))
+            exit(1)
+        return [self.__completeJob({"image": image, **template}) for image in sorted(images)]
+
+    def __runJobs(self, jobs: list) -> bool:
+        """ Runs the jobs in worker processes, prints the results as they finish and returns whether any job failed """
+        failed = False
+        with ProcessPoolExecutor(max_workers=self.__args["j"]) as executor:
+            futures = {}
+            for jobIndex, job in enumerate(jobs):
+                if "error" in job:
+                    print(json.dumps({"job": jobIndex, **job}), flush=True)
+                    failed = True
+                    continue
+                futures[executor.submit(runJob, job)] = (jobIndex, job)
+
+            for future in as_completed(futures):
+                jobIndex, job = futures[future]
+                try: result = future.result()
+                except Exception as e: result = {"image": job["image"], "error": 3, "description": str(e)}
+                failed = failed or "error" in result
+                print(json.dumps({"job": jobIndex, **result}), flush=True)
+        return failed
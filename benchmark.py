@@ -0,0 +1,203 @@
+"""
+
+imgwriter / benchmark.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+# THIS SCRIPT IS USED TO MEASURE THE PERFORMANCE OF WRITER AND READER
+# NO NEED TO DISTRIBUTE THIS SCRIPT IN RELEASES
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import struct
+import tempfile
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+from math import sqrt
+from statistics import median
+from multiprocessing import get_context
+from time import perf_counter
+
+try: import resource
+except ImportError: resource = None
+
+
+def _peakMemory() -> int:
+    """ Returns the peak resident set size of this process in bytes, or None if it is unknown """
+    if resource is None: return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak*1024
+
+def _writePngChunk(file, chunkType: bytes, data: bytes) -> None:
+    file.write(struct.pack(">I", len(data)) + chunkType + data + struct.pack(">I", zlib.crc32(chunkType + data)))
+
+def _writeCarrier(path: str, width: int, height: int, mode: str) -> None:
+    """ Writes a PNG carrier row by row, so that even carriers over Image.MAX_IMAGE_PIXELS are not held in memory """
+    # every row is the same random row, generating random data for every pixel would take longer than the case itself
+    row = b"\0" + os.urandom(width*len(mode))
+    compressor, data = zlib.compressobj(1), bytearray()
+    with open(path, "wb") as file:
+        file.write(b"\x89PNG\r\n\x1a\n")
+        _writePngChunk(file, b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2 if mode == "RGB" else 6, 0, 0, 0))
+        for _ in range(height):
+            data += compressor.compress(row)
+            if len(data) >= 1024*1024:
+                _writePngChunk(file, b"IDAT", bytes(data))
+                data.clear()
+        _writePngChunk(file, b"IDAT", bytes(data + compressor.flush()))
+        _writePngChunk(file, b"IEND", b"")
+
+def _runCase(width: int, height: int, mode: str, payloadLength: int, useNumpy: bool, workers: int, stream: bool, tempDir: str) -> dict:
+    """
+    Runs one benchmark case in a fresh process so that its peak memory is not mixed with other cases
+    With stream the carrier is written with pngstream.writeStream instead of Writer and Writer.save
+    """
+    from PIL import Image
+    import main, codec
+    if not useNumpy: codec.numpy = None
+
+    payload = os.urandom(payloadLength)
+    path = os.path.join(tempDir, f"benchmark_{os.getpid()}.png")
+    timings = {}
+
+    if stream:
+        from pngstream import writeStream
+        carrierPath = os.path.join(tempDir, f"benchmark_{os.getpid()}_carrier.png")
+        _writeCarrier(carrierPath, width, height, mode)
+        startTime = perf_counter()
+        writeStream(carrierPath, path, payload, "bin", workers=workers)
+        timings["writeStream"] = perf_counter() - startTime
+        os.remove(carrierPath)
+    else:
+        image = Image.frombytes(mode, (width, height), os.urandom(width*height*len(mode)))
+        startTime = perf_counter()
+        writer = main.Writer(image, payload, "bin", workers=workers)
+        timings["writer"] = perf_counter() - startTime
+
+        startTime = perf_counter()
+        writer.save(path)
+        timings["save"] = perf_counter() - startTime
+        del writer, image
+
+    startTime = perf_counter()
+    reader = main.Reader(path, workers=workers)
+    timings["reader"] = perf_counter() - startTime
+    if reader.payloadBinary != payload:
+        raise ValueError("Payload read back differs from the written one")
+
+    startTime = perf_counter()
+    sha256(payload).digest()
+    timings["checksum"] = perf_counter() - startTime
+
+    fileSize = os.path.getsize(path)
+    os.remove(path)
+    return {
+        "seconds": timings,
+        "payloadMBps": {phase: payloadLength / seconds / 1e6 if seconds > 0 else None for phase, seconds in timings.items()},
+        "fileSize": fileSize,
+        "peakRss": _peakMemory()
+    }
+
+
+class Benchmark:
+    def __init__(self) -> None:
+        self.__parseArguments()
+        results = {"environment": self.__environment()}
+        if self.__args["startup"] is not None: results["startup"] = self.__measureStartup(self.__args["startup"])
+        else: results["results"] = self.__runCases()
+        output = json.dumps(results, indent=2)
+        if self.__args["o"] is None: print(output)
+        else:
+            with open(self.__args["o"], "w") as file: file.write(output + os.linesep)
+
+    def __parseArguments(self) -> None:
+        parser = argparse.ArgumentParser(description="Measure the throughput and memory usage of Writer and Reader")
+        parser.add_argument("-s", metavar="MP", default="1,12,24,50", help="Comma-separated carrier sizes in megapixels (default 1,12,24,50)")
+        parser.add_argument("-c", metavar="MODES", default="RGB,RGBA", help="Comma-separated color modes (default RGB,RGBA)")
+        parser.add_argument("-p", metavar="PAYLOADS", default="16,1%,full",
+            help="Comma-separated payload sizes as bytes, percentage of capacity or full (default 16,1%%,full)")
+        parser.add_argument("-o", metavar="PATH", help="Save the JSON results to file instead of printing them")
+        parser.add_argument("--no-numpy", action="store_true", help="Measure the lookup table codec used without NumPy instead of the NumPy codec")
+        parser.add_argument("-j", metavar="WORKERS", type=int, help="Encode and decode with this many worker processes (default none)")
+        parser.add_argument("--stream", action="store_true",
+            help="Write with pngstream.writeStream, which also works with carriers over Pillow's MAX_IMAGE_PIXELS, such as -s 380")
+        parser.add_argument("--startup", metavar="RUNS", type=int, help="Measure the startup time of cli.py over RUNS runs instead of Writer and Reader")
+        self.__args = vars(parser.parse_args())
+
+    def __environment(self) -> dict:
+        import main, codec, PIL
+        return {
+            "imgwriter": main.__version__,
+            "python": platform.python_version(),
+            "pillow": PIL.__version__,
+            "numpy": None if codec.numpy is None or self.__args["no_numpy"] else codec.numpy.__version__,
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "workers": self.__args["j"]
+        }
+
+    def __measureStartup(self, runs: int) -> dict:
+        """ Returns the median wall time of cli.py calls that do not touch any image, and of importing main for comparison """
+        cliPath = os.path.join(os.path.split(os.path.abspath(__file__))[0], "cli.py")
+        commands = {
+            "python": [sys.executable, "-c", "pass"],
+            "version": [sys.executable, cliPath, "-v"],
+            "help": [sys.executable, cliPath, "--help"],
+            "argumentError": [sys.executable, cliPath],
+            "importMain": [sys.executable, "-c", "import main"]
+        }
+        # the daemon would skew the results
+        environment = {name: value for name, value in os.environ.items() if name != "IMGWRITER_DAEMON"}
+        environment["IMGWRITER_DAEMON"] = os.path.join(tempfile.gettempdir(), "imgwriter-benchmark-no-daemon.sock")
+
+        results = {}
+        for name, command in commands.items():
+            print(f"Running {name}", file=sys.stderr)
+            timings = []
+            for _ in range(runs):
+                startTime = perf_counter()
+                subprocess.run(command, cwd=os.path.split(cliPath)[0], env=environment, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                timings.append(perf_counter() - startTime)
+            results[name] = {"medianSeconds": median(timings), "minSeconds": min(timings)}
+        return results
+
+    def __payloadLength(self, spec: str, capacity: int) -> int:
+        if spec == "full": return capacity
+        if spec.endswith("%"): return int(capacity * float(spec[:-1]) / 100)
+        return min(int(spec), capacity)
+
+    def __runCases(self) -> list:
+        results = []
+        with tempfile.TemporaryDirectory() as tempDir:
+            for megapixels in self.__args["s"].split(","):
+                # carriers have 4:3 aspect ratio
+                pixelCount = int(float(megapixels) * 1e6)
+                width = int(sqrt(pixelCount * 4/3))
+                height = pixelCount // width
+                for mode in self.__args["c"].split(","):
+                    for payloadSpec in self.__args["p"].split(","):
+                        payloadLength = self.__payloadLength(payloadSpec, width*height - 51)
+                        case = {"megapixels": float(megapixels), "width": width, "height": height, "mode": mode, "payloadLength": payloadLength}
+                        print(f"Running {case}", file=sys.stderr)
+
+                        # every case gets a fresh process to measure its peak memory
+                        with ProcessPoolExecutor(max_workers=1, mp_context=get_context("spawn")) as executor:
+                            future = executor.submit(_runCase, width, height, mode, payloadLength, not self.__args["no_numpy"], self.__args["j"],
+                                self.__args["stream"], tempDir)
+                            try: case.update(future.result())
+                            except Exception as e: case["error"] = str(e)
+                        results.append(case)
+        return results
+
+
+if __name__ == "__main__":
+    Benchmark()
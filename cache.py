@@ -0,0 +1,215 @@
+"""
+
+imgwriter / cache.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+from main import Writer, Reader, Shard, CHUNK_SIZE
+from version import __version__
+from PIL import Image
+from functools import lru_cache
+from hashlib import sha256
+import io
+import json
+import os
+import shutil
+import tempfile
+
+# file locking keeps the eviction of concurrent processes apart, where available
+try: import fcntl
+except ImportError: fcntl = None
+
+DEFAULT_MAX_BYTES = 1024**3
+
+# the whole directory is scanned when the running total of its size crosses maxBytes, and at least every this many stores
+_SCAN_INTERVAL = 64
+# eviction makes room down to this share of maxBytes, so that a full cache is not scanned again on every store
+_EVICT_TO = 0.9
+
+# options that do not change the result are left out of the key
+_IGNORED_OPTIONS = ["stats", "progress", "workers"]
+
+
+def _hashFile(file) -> bytes:
+    checksum = sha256()
+    while chunk := file.read(CHUNK_SIZE): checksum.update(chunk)
+    return checksum.digest()
+
+@lru_cache(maxsize=64)
+def _hashPath(path: str, modificationTime: int, size: int) -> bytes:
+    """ Returns the hash of a file, a lookup followed by a read on a miss hashes the file only once """
+    with open(path, "rb") as file: return _hashFile(file)
+
+def _hashImage(image) -> bytes:
+    """ Returns the hash of the image file, or of the pixels of a Pillow image """
+    if isinstance(image, Image.Image):
+        return sha256(f"{image.mode} {image.width}x{image.height}".encode("utf-8") + image.tobytes()).digest()
+    if type(image) is not str:
+        raise ValueError(f"Parameter image should be string or Pillow image, but {type(image)} was given")
+    status = os.stat(image)
+    return _hashPath(os.path.abspath(image), status.st_mtime_ns, status.st_size)
+
+def _hashPayload(payload) -> tuple:
+    """ Returns the hash of the payload and the payload to write, files that cannot be rewound are read into memory """
+    if type(payload) is bytes: return sha256(payload).digest(), payload
+    if isinstance(payload, os.PathLike):
+        with open(payload, "rb") as file: return _hashFile(file), payload
+    if type(payload) is dict:
+        checksum, members = sha256(), {}
+        for name, member in payload.items():
+            memberHash, members[name] = _hashPayload(member)
+            checksum.update(name.encode("utf-8") + b"\0" + memberHash)
+        return checksum.digest(), members
+    if not hasattr(payload, "read"):
+        raise ValueError(f"Parameter payload should be bytes, file, path or dict, but {type(payload)} was given")
+    try:
+        position = payload.tell()
+        payloadHash = _hashFile(payload)
+        payload.seek(position)
+        return payloadHash, payload
+    except (AttributeError, OSError):
+        payload = payload.read()
+        return sha256(payload).digest(), payload
+
+def _optionValue(value):
+    if isinstance(value, Shard): return [*value[:4], value.checksum.hex()]
+    return value
+
+
+class ResultCache:
+    def __init__(self, directory: str, maxBytes: int = DEFAULT_MAX_BYTES) -> None:
+        """
+        On-disk cache of written images and read payloads, keyed by the content of the carrier image, the payload and the options
+        Several processes can share the directory, the least recently used entries are removed when it grows over maxBytes
+        """
+        if type(maxBytes) is not int or maxBytes < 0:
+            raise ValueError(f"Parameter maxBytes should be a non-negative integer, but {maxBytes!r} was given")
+        self.__directory, self.__maxBytes = directory, maxBytes
+        os.makedirs(directory, exist_ok=True)
+
+    def __key(self, kind: str, imageHash: bytes, details: dict) -> str:
+        details = {name: _optionValue(value) for name, value in details.items() if name not in _IGNORED_OPTIONS}
+        keyText = json.dumps([__version__, kind, imageHash.hex(), details], sort_keys=True)
+        return sha256(keyText.encode("utf-8")).hexdigest()
+
+    def __entryPath(self, key: str) -> str:
+        return os.path.join(self.__directory, key[:2], key)
+
+    def __lookup(self, key: str):
+        """ Returns an open file of the entry, or None on a miss """
+        try: file = open(self.__entryPath(key), "rb")
+        except FileNotFoundError: return None
+        # the modification time tells how recently the entry was used
+        try: os.utime(self.__entryPath(key))
+        except OSError: pass
+        return file
+
+    def __store(self, key: str, source) -> None:
+        """ Adds the contents of a path or a file-like object to the cache """
+        entryPath = self.__entryPath(key)
+        os.makedirs(os.path.dirname(entryPath), exist_ok=True)
+
+        # other processes see either the whole entry or nothing
+        fileDescriptor, temporaryPath = tempfile.mkstemp(dir=os.path.dirname(entryPath), prefix=".tmp-")
+        try:
+            with os.fdopen(fileDescriptor, "wb") as file:
+                if hasattr(source, "read"): shutil.copyfileobj(source, file, CHUNK_SIZE)
+                else:
+                    with open(source, "rb") as sourceFile: shutil.copyfileobj(sourceFile, file, CHUNK_SIZE)
+            entrySize = os.path.getsize(temporaryPath)
+            if entrySize > self.__maxBytes:
+                os.remove(temporaryPath)
+                return
+            os.replace(temporaryPath, entryPath)
+        except BaseException:
+            if os.path.exists(temporaryPath): os.remove(temporaryPath)
+            raise
+        self.__addSize(entrySize)
+
+    def __addSize(self, entrySize: int) -> None:
+        """ Adds a stored entry to the running total of the cache size kept in the directory, and evicts entries when it is over maxBytes """
+        with open(os.path.join(self.__directory, ".lock"), "wb") as lockFile:
+            if fcntl is not None: fcntl.flock(lockFile, fcntl.LOCK_EX)
+            sizePath = os.path.join(self.__directory, ".size")
+            try:
+                with open(sizePath, "r") as file: totalSize, stores = json.load(file)
+            except (OSError, ValueError): totalSize, stores = None, 0
+
+            # the total misses replaced and removed entries, which the scan corrects
+            if totalSize is None or totalSize + entrySize > self.__maxBytes or stores + 1 >= _SCAN_INTERVAL:
+                totalSize, stores = self.__evict(), 0
+            else: totalSize, stores = totalSize + entrySize, stores + 1
+            with open(sizePath, "w") as file: json.dump([totalSize, stores], file)
+
+    def __evict(self) -> int:
+        """ Removes the least recently used entries if the cache is over maxBytes and returns the size left, call with the lock held """
+        entries, totalSize = [], 0
+        for root, _, files in os.walk(self.__directory):
+            for filename in files:
+                if filename.startswith("."): continue
+                try: status = os.stat(os.path.join(root, filename))
+                except FileNotFoundError: continue
+                entries.append((status.st_mtime, status.st_size, os.path.join(root, filename)))
+                totalSize += status.st_size
+        if totalSize <= self.__maxBytes: return totalSize
+        for _, size, path in sorted(entries):
+            if totalSize <= self.__maxBytes*_EVICT_TO: break
+            try: os.remove(path)
+            except FileNotFoundError: pass
+            totalSize -= size
+        return totalSize
+
+    def write(self, image, payload, dataType: str, path, addExif: bool = False, profile: str = "default", **options) -> bool:
+        """
+        Same as Writer followed by Writer.save to path, see Writer for the parameters in options
+        Returns True if the image was copied from the cache without encoding it, an image given as Pillow image is then left unmodified
+        """
+        payloadHash, payload = _hashPayload(payload)
+        extension = os.path.splitext(os.fspath(path))[1].lower()
+        key = self.__key("write", _hashImage(image), {"payload": payloadHash.hex(), "dataType": dataType, "addExif": addExif,
+            "profile": profile, "extension": extension, **options})
+        cachedFile = self.__lookup(key)
+        if cachedFile is not None:
+            with cachedFile, open(path, "wb") as file: shutil.copyfileobj(cachedFile, file, CHUNK_SIZE)
+            return True
+
+        Writer(image, payload, dataType, **options).save(path, addExif, profile)
+        self.__store(key, path)
+        return False
+
+    def lookup(self, image, member: str = None):
+        """
+        Returns an open binary file of the payload read earlier with read, or None on a miss
+        Neither the pixels nor the header are decoded, a hit without member is never a container as they are not stored
+        """
+        return self.__lookup(self.__key("read", _hashImage(image), {"member": member}))
+
+    def read(self, image, output = None, member: str = None, **options) -> bytearray:
+        """
+        Same as Reader, or Reader.readMember if member is given, see Reader for the parameters in options
+        Returns the payload, or None if output was given
+        """
+        cachedFile = self.lookup(image, member)
+        if cachedFile is not None:
+            with cachedFile:
+                if output is None: return bytearray(cachedFile.read())
+                if hasattr(output, "write"): shutil.copyfileobj(cachedFile, output, CHUNK_SIZE)
+                else:
+                    with open(output, "wb") as file: shutil.copyfileobj(cachedFile, file, CHUNK_SIZE)
+            return None
+
+        # a payload that fails its checksum is never stored, and neither is a whole container, see lookup
+        key = self.__key("read", _hashImage(image), {"member": member})
+        if member is not None: payload = Reader(image, readPayload=False, **options).readMember(member, output)
+        else:
+            reader = Reader(image, output=output, **options)
+            if reader.members is not None: return reader.payloadBinary
+            payload = reader.payloadBinary
+        if payload is not None:
+            self.__store(key, io.BytesIO(payload))
+        elif not hasattr(output, "write"): self.__store(key, output)
+        return payload
@@ -8,58 +8,109 @@ File created on 2022-08-20
 
 """
 
-import main
-from main import Reader, Writer
+# only light modules are imported here, main and Pillow are imported when an image is actually processed
+# so that --help, -v, argument errors and calls forwarded to the daemon start fast, see benchmark.py --startup
+from daemon import forward
+from filenames import extractFileExtension, addFileNameComponent
+from version import __version__
 import argparse
+import io
 import os
 import json
+import shutil
+import sys
 from base64 import b64encode
+from pathlib import Path
 
 class App:
-    def __init__(self) -> None:
-        self.__parseArguments()
+    def __init__(self, arguments: list = None) -> None:
+        """ param arguments are the command line arguments without the program name, by default sys.argv """
+        self.__parseArguments(arguments)
+        if self.__args["stats"] == True:
+            from main import Stats
+            self.__stats = Stats()
+        else: self.__stats = None
+
+        # errors exit the program, so the profile is saved in any case
+        profiler = None
+        if self.__args["profile"] is not None:
+            import cProfile
+            profiler = cProfile.Profile()
+            profiler.enable()
+        try:
+            self.__run()
+        finally:
+            if profiler is not None:
+                profiler.disable()
+                profiler.dump_stats(self.__args["profile"])
+
+    def __run(self) -> None:
         try:
             self.__decideReadWrite()
-            if self.__isWriteMode: self.__performWrite()
+            self.__prepareStandardStreams()
+            if self.__mode == "write": self.__performWrite()
+            elif self.__mode == "info": self.__performInfo()
+            elif self.__mode == "verify": self.__performVerify()
             else: self.__performRead()
         except Exception as e:
             self.__handleError(3, str(e))
 
-    def __parseArguments(self) -> None:
+    def __parseArguments(self, arguments: list) -> None:
         desc = os.linesep.join([
             "Store data inside images",
             "Copyright (c) 2022 Pyry Lahtinen",
             "https://github.com/PyryL/imgwriter",
-            "For legal purposes only."
+            "For legal purposes only.",
+            "",
+            "Run 'cli.py batch --help' to learn how to process many images at once.",
+            "Run 'cli.py daemon --help' to learn how to skip the startup time of every call.",
+            "Run 'cli.py index --help' to learn how to find images with data or free space in large archives."
         ])
         parser = argparse.ArgumentParser(description=desc, formatter_class=argparse.RawDescriptionHelpFormatter)
 
-        parser.add_argument("image", help="The image containing data")
+        parser.add_argument("image", help="The image containing data, - to read it from stdin")
         parser.add_argument("-i", action="store_true", help="Overwrite the original image (with -t and -f)")
         parser.add_argument("-e", action="store_true", help="Add imgwriter to image's exif data (with -t and -f)")
         parser.add_argument("-s", action="store_true", help="Silent mode")
         parser.add_argument("-m", action="store_true", help="Machine readable mode")
-        parser.add_argument("-v", action="version", version=main.__version__)
+        parser.add_argument("-v", action="version", version=__version__)
 
         # write arguments
         storeDataGroup = parser.add_mutually_exclusive_group()
         storeDataGroup.add_argument("-t", metavar="TEXT", help="Store text inside the image")
-        storeDataGroup.add_argument("-f", metavar="PATH", help="Store contents of file inside the image")
+        storeDataGroup.add_argument("-f", metavar="PATH", action="append", help="Store contents of file inside the image, - to read it from stdin, repeat to store several files as a container")
+        parser.add_argument("-c", metavar="CODEC", choices=["none", "zlib", "bz2", "lzma", "auto"], help="Compress the stored data with none, zlib, bz2, lzma or auto to pick the smallest (with -t and -f)")
+        parser.add_argument("--save", metavar="PROFILE", choices=["default", "fast", "small", "webp", "tiff"], default="default",
+            help="Save quickly with fast, as the smallest PNG with small, or as lossless webp or tiff (with -t and -f)")
+        parser.add_argument("--stream", action="store_true", help="Write a PNG image row by row with little memory, for very large images (with -t and -f)")
+        parser.add_argument("--digests", action="store_true", help="Store a checksum of every 64 KiB so that damaged parts can be located with --verify (with -t and -f)")
+        parser.add_argument("-d", metavar="DENSITY", choices=["standard", "rgb16", "rgba16"], default="standard", help="Store more data per pixel with rgb16 or rgba16 at the cost of more visible noise (with -t and -f)")
 
         # read arguments
         readDataGroup = parser.add_mutually_exclusive_group()
         readDataGroup.add_argument("-p", action="store_true", help="Print the image content to terminal")
-        readDataGroup.add_argument("-o", metavar="PATH", help="Save the image content to file")
+        readDataGroup.add_argument("-o", metavar="PATH", help="Save the image content to file, or with -t and -f the image, - to write it to stdout")
+        readDataGroup.add_argument("--info", action="store_true", help="Print information about the content without reading it")
+        readDataGroup.add_argument("--verify", action="store_true", help="Check the content and print which parts of it are intact")
+        parser.add_argument("--member", metavar="NAME", help="Read only this file of a container (with -p and -o), -o without it extracts every file to the directory")
 
-        self.__args = vars(parser.parse_args())
+        # performance arguments
+        parser.add_argument("-j", metavar="WORKERS", type=int, help="Encode or decode large payloads with this many worker processes")
+        parser.add_argument("--stats", action="store_true", help="Print the time spent in every phase of reading or writing")
+        parser.add_argument("--profile", metavar="PATH", help="Save cProfile statistics of the run to file")
+        parser.add_argument("--cache", metavar="DIR", default=os.environ.get("IMGWRITER_CACHE"),
+            help="Reuse the results of earlier identical writes and reads stored in this directory (default from IMGWRITER_CACHE)")
+
+        self.__args = vars(parser.parse_args(arguments))
+        if self.__args["j"] is not None and self.__args["j"] < 1:
+            parser.error("there must be at least one worker")
         self.__silentMode = self.__args["s"] == True
         self.__machineMode = self.__args["m"] == True
+        self.__dataToStdout = False
 
-    def __extractFileExtension(self, path: str) -> str:
-        """ returns the file extension of the path, or None if such doesn't exist """
-        filename = os.path.split(path)[1]
-        if "." not in filename or filename.rfind(".") == 0: return None
-        return filename.split(".")[-1]
+    def __print(self, text: str) -> None:
+        """ Prints a message, to stderr if stdout carries the image or the data """
+        print(text, file=sys.stderr if self.__dataToStdout else sys.stdout)
 
     def __handleError(self, errorCode: int, description: str) -> None:
         """ Print error details in wanted format and exit """
@@ -67,89 +118,283 @@ class App:
             raise ValueError()
 
         if self.__machineMode and not self.__silentMode:
-            print(json.dumps({
+            self.__print(json.dumps({
                 "error": errorCode,
                 "description": description
             }))
         elif not self.__silentMode:
-            print(description)
+            self.__print(description)
         exit(errorCode)
 
     def __decideReadWrite(self) -> None:
-        """ Decide whether should read or write data """
+        """ Decide whether should read or write data, or only inspect the header """
         if self.__args["t"] is not None or self.__args["f"] is not None:
-            self.__isWriteMode = True
+            self.__mode = "write"
+        elif self.__args["info"] == True:
+            self.__mode = "info"
+        elif self.__args["verify"] == True:
+            self.__mode = "verify"
         elif self.__args["p"] == True or self.__args["o"] is not None:
-            self.__isWriteMode = False
+            self.__mode = "read"
         else:
-            self.__handleError(1, "Neither read nor write options provided. Pass -t, -f, -p or -o, or --help to learn more.")
+            self.__handleError(1, "Neither read nor write options provided. Pass -t, -f, -p, -o, --info or --verify, or --help to learn more.")
     
-    def __addFileNameComponent(self, filename: str, component: str) -> str:
-        """
-        Adds a component to the end of the filename
-        Example: "test.png" + "foobar" -> "test.foobar.png"
-        abc.pyry.def.png
-        """
-        path, file = os.path.split(filename)
-        if "." in file: file = ".".join(file.split(".")[:-1]) + "." + component + "." + file.split(".")[-1]
-        else: file += "_" + component
-        return os.path.join(path, file)
+    def __prepareStandardStreams(self) -> None:
+        """ Checks the uses of - for stdin and stdout, and reads a carrier image from stdin into memory """
+        filesFromStdin = [self.__args["image"], *(self.__args["f"] or [])].count("-")
+        if filesFromStdin > 1:
+            self.__handleError(1, "Only one of the image and the file to store can be read from stdin")
+        if self.__args["f"] is not None and len(self.__args["f"]) > 1 and "-" in self.__args["f"]:
+            self.__handleError(1, "Several files cannot be stored when one of them is read from stdin")
+        if self.__args["i"] == True and self.__mode == "write" and (self.__args["image"] == "-" or self.__args["o"] is not None):
+            self.__handleError(1, "Pass either -i or -o, and -i only with an image file")
+
+        # an image from stdin is written to stdout by default
+        self.__dataToStdout = self.__args["o"] == "-" or (self.__mode == "write" and self.__args["image"] == "-" and self.__args["o"] is None)
+        self.__useCache = self.__args["cache"] is not None and filesFromStdin == 0 and not self.__dataToStdout
+
+        # the image is decoded row by row from memory like from a file
+        self.__image = self.__args["image"]
+        if self.__image == "-": self.__image = io.BytesIO(sys.stdin.buffer.read())
+
+    def __addStats(self, result: dict) -> dict:
+        """ Adds the phase timings to the machine readable result if they were requested """
+        if self.__stats is not None:
+            result["stats"] = {"phases": self.__stats.phases, "totalSeconds": self.__stats.totalSeconds}
+        return result
+
+    def __printStats(self) -> None:
+        """ Prints the phase timings in human readable form to stderr, so that they do not mix with the payload """
+        if self.__stats is None or self.__machineMode or self.__silentMode: return
+        for phase, totals in self.__stats.phases.items():
+            throughput = "" if totals["MBps"] is None or totals["bytes"] == 0 else f", {totals['MBps']:.1f} MB/s"
+            print(f"{phase}: {totals['seconds']*1000:.1f} ms{throughput}", file=sys.stderr)
+        print(f"total: {self.__stats.totalSeconds*1000:.1f} ms", file=sys.stderr)
 
     def __performWrite(self) -> None:
+        from main import Writer, SAVE_PROFILES
+        from PIL import Image
+
         # get payload
         if self.__args["t"] is not None:
             payload = str(self.__args["t"]).encode("utf-8")
             dataType = "txt"
         else:
-            try:
-                with open(self.__args["f"], "rb") as file: payload = file.read()
-                dataType = self.__extractFileExtension(self.__args["f"])
-            except FileNotFoundError:
-                self.__handleError(2, f"File '{self.__args['f']}' not found")
-        
-        # come up with the saving filename
-        if self.__args["i"] == True: savingFilename = self.__args["image"]
-        else: savingFilename = self.__addFileNameComponent(self.__args["image"], "data")
+            # the files are streamed into the image instead of reading them into memory
+            for path in self.__args["f"]:
+                if path != "-" and not Path(path).exists(): self.__handleError(2, f"File '{path}' not found")
+            if self.__args["f"] == ["-"]:
+                payload, dataType = sys.stdin.buffer, ""
+            elif len(self.__args["f"]) == 1:
+                payload = Path(self.__args["f"][0])
+                dataType = extractFileExtension(self.__args["f"][0])
+            else:
+                # several files are stored as a container with the file names as member names
+                payload = {}
+                for path in self.__args["f"]:
+                    name = os.path.basename(path)
+                    if name in payload: self.__handleError(1, f"Two files are named '{name}', a container needs unique names")
+                    payload[name] = Path(path)
+                dataType = ""
         
+        # come up with the saving filename, with the extension of the format of the save profile
+        if self.__dataToStdout: savingFilename = "-"
+        elif self.__args["o"] is not None: savingFilename = self.__args["o"]
+        elif self.__args["i"] == True: savingFilename = self.__args["image"]
+        else: savingFilename = addFileNameComponent(self.__args["image"], "data")
+        imageFormat = SAVE_PROFILES[self.__args["save"]][0]
+        extension = "." + (extractFileExtension(savingFilename) or "").lower()
+        if imageFormat is not None and not self.__dataToStdout and Image.registered_extensions().get(extension) != imageFormat:
+            if self.__args["o"] is not None:
+                self.__handleError(1, f"Output file '{savingFilename}' does not have a file extension of {imageFormat} format. Change -o or --save.")
+            if self.__args["i"] == True:
+                self.__handleError(1, f"The original image cannot be overwritten in {imageFormat} format. Leave out -i.")
+            savingFilename = os.path.splitext(savingFilename)[0] + "." + imageFormat.lower()
+
         # write payload and save
         addExif = self.__args["e"] == True
-        Writer(self.__args["image"], payload, dataType).save(savingFilename, addExif)
+        options = {"compression": self.__args["c"], "density": self.__args["d"], "stats": self.__stats, "workers": self.__args["j"],
+            "digests": self.__args["digests"]}
+        if self.__args["stream"] == True:
+            self.__performStreamWrite(payload, dataType, savingFilename, options)
+        elif self.__useCache:
+            from cache import ResultCache
+            ResultCache(self.__args["cache"]).write(self.__image, payload, dataType, savingFilename, addExif, self.__args["save"], **options)
+        elif self.__dataToStdout:
+            # the image is encoded straight to stdout
+            Writer(self.__image, payload, dataType, **options).save(sys.stdout.buffer, addExif, self.__args["save"])
+            sys.stdout.buffer.flush()
+        else:
+            Writer(self.__image, payload, dataType, **options).save(savingFilename, addExif, self.__args["save"])
 
         if self.__machineMode and not self.__silentMode:
-            print(json.dumps({
+            self.__print(json.dumps(self.__addStats({
                 "success": True,
-                "path": os.path.abspath(savingFilename)
-            }))
+                "path": "-" if self.__dataToStdout else os.path.abspath(savingFilename)
+            })))
         elif not self.__silentMode:
-            print(f"Writing done and image saved to '{savingFilename}'")
+            self.__print("Writing done and image written to stdout" if self.__dataToStdout else f"Writing done and image saved to '{savingFilename}'")
+            self.__printStats()
+
+    def __performStreamWrite(self, payload, dataType: str, savingFilename: str, options: dict) -> None:
+        """ Writes the image row by row with pngstream.py, which keeps only the rows holding the data in memory """
+        from pngstream import writeStream
+        compressLevels = {"default": 6, "fast": 1, "small": 9}
+        if self.__args["save"] not in compressLevels:
+            self.__handleError(1, "Only PNG images can be streamed. Use --save default, fast or small with --stream.")
+        if self.__args["e"] == True:
+            self.__handleError(1, "Exif data cannot be added to a streamed image. Leave out -e.")
+        if self.__args["i"] == True:
+            self.__handleError(1, "The original image cannot be overwritten while it is streamed. Leave out -i.")
+        output = sys.stdout.buffer if self.__dataToStdout else savingFilename
+        writeStream(self.__image, output, payload, dataType, compressLevels[self.__args["save"]], **options)
+        if self.__dataToStdout: sys.stdout.buffer.flush()
 
     def __performRead(self) -> None:
-        # get the payload from image
-        payload = Reader(self.__args["image"]).payloadBinary
+        from main import Reader
+        member = self.__args["member"]
+
+        # a cached payload is served without decoding even the header, whole containers are never cached
+        cache = None
+        if self.__useCache:
+            from cache import ResultCache
+            cache = ResultCache(self.__args["cache"])
+            cachedFile = cache.lookup(self.__image, member)
+            if cachedFile is not None:
+                with cachedFile:
+                    if self.__args["p"] == True: self.__printPayload(cachedFile.read())
+                    else:
+                        with open(self.__args["o"], "wb") as file: shutil.copyfileobj(cachedFile, file)
+                        self.__reportSavedPayload()
+                return
+
+        reader = Reader(self.__image, readPayload=False, stats=self.__stats, workers=self.__args["j"])
+        if reader.members is not None and member is None:
+            if self.__args["p"] == True or self.__dataToStdout:
+                self.__handleError(1, "The image contains several files. Pass --member to print one of them, or --info to list them.")
+            self.__extractMembers(reader)
+            return
 
         # handle the payload
         if self.__args["p"] == True:
-            # convert payload bytes to str
-            try: payloadStr = (payload.decode("utf-8"), False)
-            except UnicodeDecodeError: payloadStr = (b64encode(payload).decode("utf-8"), True)
-
-            if self.__machineMode:
-                objectToPrint = {"success": True, "payload": payloadStr[0]}
-                if payloadStr[1]: objectToPrint["base64"] = True
-                print(json.dumps(objectToPrint))
+            # get the payload from image
+            if cache is not None: payload = cache.read(self.__image, member=member, stats=self.__stats, workers=self.__args["j"])
+            elif member is not None: payload = reader.readMember(member)
             else:
-                if payloadStr[1]: print(f"NOTE: Here is the base64 encoded representation of {len(payload)} original bytes")
-                print(payloadStr[0])
+                # the payload grows as it is decoded instead of allocating the length claimed by the header
+                payloadFile = io.BytesIO()
+                reader.extract(payloadFile)
+                payload = payloadFile.getvalue()
+            self.__printPayload(payload)
         else:
-            with open(self.__args["o"], "wb") as file:
-                file.write(payload)
-            if self.__machineMode:
-                print(json.dumps({
-                    "success": True,
-                    "path": os.path.abspath(self.__args["o"])
-                }))
+            # stream the payload straight to the file or stdout
+            output = sys.stdout.buffer if self.__dataToStdout else self.__args["o"]
+            if cache is not None: cache.read(self.__image, output, member, stats=self.__stats, workers=self.__args["j"])
+            elif member is not None: reader.readMember(member, output)
+            else: reader.extract(output)
+            if self.__dataToStdout: sys.stdout.buffer.flush()
+            self.__reportSavedPayload()
+
+    def __printPayload(self, payload: bytes) -> None:
+        # convert payload bytes to str
+        try: payloadStr = (payload.decode("utf-8"), False)
+        except UnicodeDecodeError: payloadStr = (b64encode(payload).decode("utf-8"), True)
+
+        if self.__machineMode:
+            objectToPrint = {"success": True, "payload": payloadStr[0]}
+            if payloadStr[1]: objectToPrint["base64"] = True
+            print(json.dumps(self.__addStats(objectToPrint)))
+        else:
+            if payloadStr[1]: print(f"NOTE: Here is the base64 encoded representation of {len(payload)} original bytes")
+            print(payloadStr[0])
+            self.__printStats()
+
+    def __reportSavedPayload(self) -> None:
+        if self.__machineMode:
+            self.__print(json.dumps(self.__addStats({
+                "success": True,
+                "path": "-" if self.__dataToStdout else os.path.abspath(self.__args["o"])
+            })))
+        elif not self.__dataToStdout:
+            print(f"Data read and saved to '{self.__args['o']}'")
+            self.__printStats()
+
+    def __extractMembers(self, reader) -> None:
+        """ Saves every member of a container to the output directory """
+        directory = self.__args["o"]
+        os.makedirs(directory, exist_ok=True)
+        members = reader.members
+        for member in members:
+            # member names cannot contain path separators, so the files stay in the directory
+            reader.readMember(member.name, os.path.join(directory, member.name))
+
+        if self.__machineMode:
+            print(json.dumps(self.__addStats({
+                "success": True,
+                "path": os.path.abspath(directory),
+                "members": [member.name for member in members]
+            })))
+        else:
+            print(f"{len(members)} files read and saved to '{directory}'")
+            self.__printStats()
+
+    def __performVerify(self) -> None:
+        from main import Reader
+        reader = Reader(self.__image, readPayload=False, stats=self.__stats, workers=self.__args["j"])
+        intactRanges = reader.verify()
+        intactLength = sum(end - start for start, end in intactRanges)
+        isIntact = intactLength == reader.storedLength
+
+        if self.__machineMode and not self.__silentMode:
+            print(json.dumps(self.__addStats({
+                "success": isIntact,
+                "storedLength": reader.storedLength,
+                "intact": [list(intactRange) for intactRange in intactRanges]
+            })))
+        elif not self.__silentMode:
+            if isIntact: print(f"All {reader.storedLength} stored bytes are intact")
             else:
-                print(f"Data read and saved to '{self.__args['o']}'")
+                print(f"{intactLength} of {reader.storedLength} stored bytes are intact")
+                for start, end in intactRanges: print(f"  bytes {start}-{end}")
+            self.__printStats()
+        if not isIntact: exit(3)
+
+    def __performInfo(self) -> None:
+        # read only the header of the image
+        from main import probe
+        info = probe(self.__image)
+
+        if self.__machineMode and not self.__silentMode:
+            print(json.dumps({"success": True, **info}))
+        elif not self.__silentMode:
+            print(f"Protocol version: {info['version']}")
+            print(f"Data type: {info['dataType']}")
+            print(f"Payload length: {info['payloadLength']} bytes")
+            if info["density"] != "standard":
+                print(f"Density profile: {info['density']}")
+            if info["compression"] != "none":
+                print(f"Compression: {info['compression']}, {info['storedLength']} bytes stored")
+            print(f"Free capacity: {info['freeCapacity']} bytes")
+            if "digestChunkSize" in info:
+                print(f"Chunk digests: every {info['digestChunkSize']} bytes")
+            if "members" in info:
+                print(f"Members: {len(info['members'])}")
+                for member in info["members"]: print(f"  {member['name']}: {member['length']} bytes")
+            print(f"SHA-256 checksum: {info['checksum']}")
 
 if __name__ == "__main__":
-    App()
+    # subcommands have their own arguments
+    if sys.argv[1:2] == ["batch"]:
+        from batch import BatchApp
+        BatchApp(sys.argv[2:])
+    elif sys.argv[1:2] == ["daemon"]:
+        from daemon import DaemonApp
+        DaemonApp(sys.argv[2:])
+    elif sys.argv[1:2] == ["index"]:
+        from index import IndexApp
+        IndexApp(sys.argv[2:])
+    else:
+        # a running daemon does the work in an already warm process, but it cannot reach the standard streams of this one
+        exitCode = forward(sys.argv[1:]) if "-" not in sys.argv[1:] else None
+        if exitCode is None: App()
+        else: exit(exitCode)
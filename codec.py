@@ -0,0 +1,226 @@
+"""
+
+imgwriter / codec.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+from PIL import Image
+from random import randbytes
+
+# NumPy is optional, main falls back to TableCodec without it
+try: import numpy
+except ImportError: numpy = None
+
+# density profiles as (bits, modulus) of every used channel, the message bits are spread over the channels in this order
+# a channel changes at most by modulus-1, so denser profiles cause more visible noise
+PROFILES = {
+    "standard": ((3, 8), (3, 8), (2, 8)),               # 1 byte per pixel, R/G/B change at most by 7
+    "rgb16": ((5, 32), (5, 32), (6, 64)),               # 2 bytes per pixel, R/G change at most by 31 and B by 63
+    "rgba16": ((4, 16), (4, 16), (4, 16), (4, 16))      # 2 bytes per pixel, R/G/B/A change at most by 15, RGBA only
+}
+PROFILE_IDS = {"standard": 0, "rgb16": 1, "rgba16": 2}
+PROFILE_NAMES = {profileId: name for name, profileId in PROFILE_IDS.items()}
+
+
+def bytesPerPixel(profile: str) -> int:
+    return sum(bits for bits, _ in PROFILES[profile]) // 8
+
+def createCodec(profile: str = "standard"):
+    """ Returns NumpyCodec if NumPy is available, otherwise TableCodec """
+    return NumpyCodec(profile) if numpy is not None else TableCodec(profile)
+
+def _cropRows(image: Image.Image, start: int, pixelCount: int) -> tuple:
+    """ Returns the raw pixel data of the rows holding the pixel span, the index of the first row and the span start within the rows """
+    width = image.width
+    top, bottom = start // width, (start + pixelCount - 1) // width + 1
+    return bytearray(image.crop((0, top, width, bottom)).tobytes()), top, start - top*width
+
+def _pasteRows(image: Image.Image, rows: bytearray, top: int) -> None:
+    height = len(rows) // (image.width*len(image.getbands()))
+    image.paste(Image.frombytes(image.mode, (image.width, height), bytes(rows)), (0, top))
+
+
+class NumpyCodec:
+    """ Encodes and decodes message bytes in the pixels of an image with array operations """
+
+    def __init__(self, profile: str = "standard") -> None:
+        if numpy is None:
+            raise ImportError("NumPy is required for the array-backed codec")
+        self.__random = numpy.random.default_rng()
+        self.__channels = PROFILES[profile]
+        self.__bytesPerPixel = bytesPerPixel(profile)
+
+    def __modifyColors(self, colors, targetMods, modulus: int):
+        """
+        Moves every color to one of the two nearest values that have the target mod
+        colors and targetMods are equal-length arrays, colors in range 0...255 and targetMods in range 0...modulus-1
+        """
+        colors = colors.astype(numpy.int16)
+        lowerColors = colors - ((colors - targetMods) & (modulus - 1))
+        higherColors = lowerColors + modulus
+
+        # choose randomly between the two nearest target mods unless one of them is out of range
+        pickHigher = self.__random.integers(0, 2, size=len(colors), dtype=numpy.uint8).astype(bool)
+        newColors = numpy.where(pickHigher, higherColors, lowerColors)
+        newColors = numpy.where(higherColors > 255, lowerColors, newColors)
+        newColors = numpy.where(lowerColors < 0, higherColors, newColors)
+
+        # colors that already have the correct mod are left untouched
+        return numpy.where(lowerColors == colors, colors, newColors).astype(numpy.uint8)
+
+    def __pixelSpan(self, pixels, bands: int, start: int, pixelCount: int):
+        """ Returns an array view to pixelCount pixels of the raw pixel buffer, starting from pixel index start """
+        return numpy.frombuffer(pixels, dtype=numpy.uint8).reshape(-1, bands)[start:start+pixelCount]
+
+    def encode(self, image: Image.Image, start: int, message) -> None:
+        """
+        Writes message bytes into the image in place, starting from pixel index start
+        param message should be bytes-like, it is padded with zeros to fill the last pixel
+        """
+        if len(message) == 0: return
+        # copy out only the rows that hold the message
+        rows, top, offset = _cropRows(image, start, -(-len(message) // self.__bytesPerPixel))
+        self.encodeBuffer(rows, len(image.getbands()), offset, message)
+        _pasteRows(image, rows, top)
+
+    def encodeBuffer(self, pixels, bands: int, start: int, message) -> None:
+        """
+        Writes message bytes into a writable raw pixel buffer, such as the tobytes() data of an image, starting from pixel index start
+        param bands is the number of channels per pixel
+        """
+        if len(message) == 0: return
+        if len(self.__channels) > bands:
+            raise ValueError(f"The density profile needs an RGBA image, but an image with {bands} channels was given")
+        pixelCount = -(-len(message) // self.__bytesPerPixel)
+        span = self.__pixelSpan(pixels, bands, start, pixelCount)
+
+        # combine the bytes of every pixel into one value and split it into parts for the channels
+        messageBytes = numpy.zeros(pixelCount*self.__bytesPerPixel, numpy.uint8)
+        messageBytes[:len(message)] = numpy.frombuffer(message, dtype=numpy.uint8)
+        values = numpy.zeros(pixelCount, numpy.uint32)
+        for i in range(self.__bytesPerPixel):
+            values = values << 8 | messageBytes[i::self.__bytesPerPixel]
+        shift = 8*self.__bytesPerPixel
+        for channel, (bits, modulus) in enumerate(self.__channels):
+            shift -= bits
+            targetMods = ((values >> shift) & ((1 << bits) - 1)).astype(numpy.int16)
+            span[:, channel] = self.__modifyColors(span[:, channel], targetMods, modulus)
+
+    def decode(self, image: Image.Image, start: int, length: int) -> bytes:
+        """ Reads length message bytes from the image starting from pixel index start """
+        if length == 0: return b""
+        # take the pixel span out as one buffer
+        rows, _, offset = _cropRows(image, start, -(-length // self.__bytesPerPixel))
+        return self.decodeBuffer(rows, len(image.getbands()), offset, length)
+
+    def decodeBuffer(self, pixels, bands: int, start: int, length: int) -> bytes:
+        """ Reads length message bytes from a raw pixel buffer starting from pixel index start """
+        if length == 0: return b""
+        pixelCount = -(-length // self.__bytesPerPixel)
+        span = self.__pixelSpan(pixels, bands, start, pixelCount)
+
+        # join the parts of every pixel, for example (R&7)<<5 | (G&7)<<2 | (B&3) with the standard profile
+        values = numpy.zeros(pixelCount, numpy.uint32)
+        for channel, (bits, _) in enumerate(self.__channels):
+            values = values << bits | (span[:, channel] & ((1 << bits) - 1))
+
+        # split the values back into bytes
+        messageBytes = numpy.empty((pixelCount, self.__bytesPerPixel), numpy.uint8)
+        for i in range(self.__bytesPerPixel):
+            messageBytes[:, i] = values >> (8*(self.__bytesPerPixel - 1 - i)) & 0xff
+        return messageBytes.tobytes()[:length]
+
+
+def _combine(*parts: bytes) -> bytes:
+    """ Returns the bitwise or of equal-length byte strings whose bits do not overlap, computed in one go with big integers """
+    combined = 0
+    for part in parts: combined |= int.from_bytes(part, "big")
+    return combined.to_bytes(len(parts[0]), "big")
+
+def _table(function) -> bytes:
+    """ Returns a 256-entry translation table for bytes.translate """
+    return bytes(function(value) for value in range(256))
+
+def _colorDelta(key: int, direction: int) -> int:
+    """
+    The key holds an edge flag, the old mod (color & 7), the target mod and a random bit as 0b_e_ooo_ttt_r
+    the edge flag tells that the color is in the last block of 8 in the direction, see _EDGE_KEY_TABLES
+    Returns 8 if the color should be moved to the next block of 8 in the direction (1 up, -1 down), otherwise 0
+    """
+    edge, oldMod, targetMod, randomBit = key >> 7, (key >> 4) & 7, (key >> 1) & 7, key & 1
+    # like in NumpyCodec, a color stays in its block only when the other candidate would be out of range 0...255
+    if edge or oldMod == targetMod or randomBit == 0: return 0
+    # (color & ~7) | targetMod is the lower of the two nearest candidates if targetMod < oldMod, otherwise the higher one
+    return 8 if (targetMod < oldMod) == (direction == 1) else 0
+
+# tables of the standard profile, where the bits of a message byte are split as RRRGGGBB
+_SPLIT_TABLES = (_table(lambda b: (b >> 5) << 1), _table(lambda b: ((b >> 2) & 7) << 1), _table(lambda b: (b & 3) << 1))
+_JOIN_TABLES = (_table(lambda c: (c & 7) << 5), _table(lambda c: (c & 7) << 2), _table(lambda c: c & 3))
+# the old mod of the color with the edge flag of moving up and of moving down
+_EDGE_KEY_TABLES = (_table(lambda c: (c & 7) << 4 | (0x80 if c >= 248 else 0)), _table(lambda c: (c & 7) << 4 | (0x80 if c < 8 else 0)))
+_BLOCK_TABLE = _table(lambda c: c & 0xf8)
+_TARGET_TABLE = _table(lambda t: t >> 1)
+_RANDOM_BIT_TABLE = _table(lambda r: r & 1)
+_UP_TABLE = _table(lambda key: _colorDelta(key, 1))
+_DOWN_TABLE = _table(lambda key: _colorDelta(key, -1))
+
+
+class TableCodec:
+    """
+    Encodes and decodes message bytes in the pixels of an image with lookup tables and the standard library only
+    Every channel is processed at once as a byte string with bytes.translate and big integer bitwise operations
+    """
+
+    def __init__(self, profile: str = "standard") -> None:
+        if profile != "standard":
+            raise ValueError(f"Density profile {profile} requires NumPy")
+
+    def encode(self, image: Image.Image, start: int, message) -> None:
+        """
+        Writes message bytes into the image in place, starting from pixel index start
+        param message should be bytes-like with one byte per pixel
+        """
+        if len(message) == 0: return
+        rows, top, offset = _cropRows(image, start, len(message))
+        self.encodeBuffer(rows, len(image.getbands()), offset, message)
+        _pasteRows(image, rows, top)
+
+    def encodeBuffer(self, pixels, bands: int, start: int, message) -> None:
+        """
+        Writes message bytes into a writable raw pixel buffer, such as the tobytes() data of an image, starting from pixel index start
+        param bands is the number of channels per pixel
+        """
+        if len(message) == 0: return
+        message, offset = bytes(message), start*bands
+        spanEnd = offset + len(message)*bands
+
+        for channel, splitTable in enumerate(_SPLIT_TABLES):
+            colors = bytes(pixels[offset+channel:spanEnd:bands])
+            targets = message.translate(splitTable)
+
+            # the nearest color with the target mod in the same block of 8, moved up or down by a block at random
+            randomBits = randbytes(len(colors)).translate(_RANDOM_BIT_TABLE)
+            upKeys, downKeys = (_combine(colors.translate(edgeTable), targets, randomBits) for edgeTable in _EDGE_KEY_TABLES)
+            newColors = int.from_bytes(_combine(colors.translate(_BLOCK_TABLE), targets.translate(_TARGET_TABLE)), "big")
+            newColors += int.from_bytes(upKeys.translate(_UP_TABLE), "big") - int.from_bytes(downKeys.translate(_DOWN_TABLE), "big")
+            pixels[offset+channel:spanEnd:bands] = newColors.to_bytes(len(colors), "big")
+
+    def decode(self, image: Image.Image, start: int, length: int) -> bytes:
+        """ Reads length message bytes from the image starting from pixel index start """
+        if length == 0: return b""
+        rows, _, offset = _cropRows(image, start, length)
+        return self.decodeBuffer(rows, len(image.getbands()), offset, length)
+
+    def decodeBuffer(self, pixels, bands: int, start: int, length: int) -> bytes:
+        """ Reads length message bytes from a raw pixel buffer starting from pixel index start """
+        if length == 0: return b""
+        offset = start*bands
+        spanEnd = offset + length*bands
+
+        # (R&7)<<5 | (G&7)<<2 | (B&3) of every pixel
+        channels = (bytes(pixels[offset+channel:spanEnd:bands]) for channel in range(len(_JOIN_TABLES)))
+        return _combine(*(channel.translate(joinTable) for channel, joinTable in zip(channels, _JOIN_TABLES)))
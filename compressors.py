@@ -0,0 +1,61 @@
+"""
+
+imgwriter / compressors.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+import zlib
+import bz2
+import lzma
+
+# codec ids stored in the header, "none" is marked by leaving the compression option out
+CODECS = {"zlib": 1, "bz2": 2, "lzma": 3}
+CODEC_NAMES = {codecId: name for name, codecId in CODECS.items()}
+
+
+def compressor(codecId: int):
+    """ Returns a new compressor object with compress and flush methods """
+    if codecId == CODECS["zlib"]: return zlib.compressobj()
+    if codecId == CODECS["bz2"]: return bz2.BZ2Compressor()
+    if codecId == CODECS["lzma"]: return lzma.LZMACompressor()
+    raise ValueError(f"Unsupported compression codec {codecId}")
+
+def _decompressPieces(decompressor, chunk: bytes, chunkSize: int):
+    """ Yields the output of one input chunk in pieces of at most chunkSize bytes """
+    # zlib keeps the input that did not fit in the output, the others keep the output
+    if isinstance(decompressor, type(zlib.decompressobj())):
+        while len(chunk) > 0:
+            yield decompressor.decompress(chunk, chunkSize)
+            chunk = decompressor.unconsumed_tail
+        return
+    yield decompressor.decompress(chunk, chunkSize)
+    while not decompressor.eof and not decompressor.needs_input:
+        yield decompressor.decompress(b"", chunkSize)
+
+def decompressChunks(codecId: int, chunks, length: int, chunkSize: int):
+    """
+    Yields the decompressed data in pieces of at most chunkSize bytes
+    Raises ValueError if the data does not decompress to exactly length bytes
+    """
+    if codecId == CODECS["zlib"]: decompressor = zlib.decompressobj()
+    elif codecId == CODECS["bz2"]: decompressor = bz2.BZ2Decompressor()
+    elif codecId == CODECS["lzma"]: decompressor = lzma.LZMADecompressor()
+    else: raise ValueError(f"Unsupported compression codec {codecId}")
+
+    decompressedLength = 0
+    try:
+        for chunk in chunks:
+            for piece in _decompressPieces(decompressor, chunk, chunkSize):
+                # the output size is limited so that a small payload cannot expand into a huge one
+                decompressedLength += len(piece)
+                if decompressedLength > length: raise ValueError("Payload corrupted")
+                if len(piece) > 0: yield piece
+    except (zlib.error, OSError, EOFError, lzma.LZMAError):
+        raise ValueError("Payload corrupted")
+
+    if not decompressor.eof or decompressedLength != length:
+        raise ValueError("Payload corrupted")
@@ -0,0 +1,231 @@
+"""
+
+imgwriter / daemon.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+# only the standard library is needed here, Pillow is loaded by the worker processes of the daemon
+import argparse
+import hmac
+import json
+import os
+import secrets
+import signal
+import socket
+import socketserver
+import sys
+import tempfile
+from threading import Lock
+
+# environment variable that overrides the address of the daemon, either a socket path or localhost port
+ADDRESS_VARIABLE = "IMGWRITER_DAEMON"
+# environment variables read by cli.py, a forwarded invocation sees the values of the client instead of the daemon
+CLIENT_VARIABLES = ["IMGWRITER_CACHE"]
+# seconds to wait for the daemon to connect and accept a request, after which the call is run locally instead
+ACCEPT_TIMEOUT = 2.0
+
+
+def defaultAddress() -> str:
+    """ Returns the address the daemon listens on and the client connects to, a Unix socket path or a port number """
+    if os.environ.get(ADDRESS_VARIABLE): return os.environ[ADDRESS_VARIABLE]
+    if not hasattr(socket, "AF_UNIX"): return "48765"
+    return os.path.join(tempfile.gettempdir(), f"imgwriter-{os.getuid()}.sock")
+
+def _isPort(address: str) -> bool:
+    return address.isdigit()
+
+def _tokenPath(address: str) -> str:
+    """ Returns the path of the file holding the secret of a daemon listening on a port, readable only by its user """
+    return os.path.join(os.path.expanduser("~"), f".imgwriter-daemon-{address}.token")
+
+def _connect(address: str) -> socket.socket:
+    """ Returns a socket connected to the daemon, raises OSError if no daemon is running """
+    if _isPort(address): return socket.create_connection(("127.0.0.1", int(address)), timeout=ACCEPT_TIMEOUT)
+    connection = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    connection.settimeout(ACCEPT_TIMEOUT)
+    try: connection.connect(address)
+    except OSError:
+        connection.close()
+        raise
+    return connection
+
+def request(message: dict, address: str = None) -> dict:
+    """
+    Sends one request to the daemon and returns its response,
+    or None if no daemon is running or it does not accept the request within ACCEPT_TIMEOUT seconds
+    message is either {"argv": [...], "cwd": ..., "env": {...}} to run a cli.py invocation or {"job": {...}, "cwd": ...} to run a batch.py job
+    """
+    address = defaultAddress() if address is None else address
+    if not _isPort(address) and not os.path.exists(address): return None
+    if _isPort(address):
+        # any local user can connect to a port, so the daemon runs only requests with the secret it gave to its own user
+        try:
+            with open(_tokenPath(address), "r") as file: message = {**message, "token": file.read().strip()}
+        except OSError: return None
+    try: connection = _connect(address)
+    except OSError: return None
+    with connection, connection.makefile("rwb") as stream:
+        try:
+            stream.write(json.dumps(message).encode("utf-8") + b"\n")
+            stream.flush()
+            # the daemon accepts the request at once, a daemon that does not is hung and the call is run locally
+            line = stream.readline()
+        except OSError: return None
+        if line.strip() == b'{"accepted": true}':
+            # the invocation itself can take as long as it needs
+            connection.settimeout(None)
+            line = stream.readline()
+    if line == b"": raise ValueError("The daemon closed the connection without a response")
+    return json.loads(line)
+
+def forward(arguments: list, address: str = None) -> int:
+    """
+    Runs a cli.py invocation in the daemon and prints its output
+    Returns the exit code, or None if no daemon is running
+    """
+    environment = {name: os.environ[name] for name in CLIENT_VARIABLES if name in os.environ}
+    response = request({"argv": arguments, "cwd": os.getcwd(), "env": environment}, address)
+    if response is None: return None
+    if "error" in response:
+        # the daemon could not run the invocation at all
+        print(response["description"], file=sys.stderr)
+        return response["error"]
+    sys.stdout.write(response["stdout"])
+    sys.stderr.write(response["stderr"])
+    return response["exitCode"]
+
+
+def _initWorker() -> None:
+    """ Imports everything a job needs so that the first job does not pay for it """
+    # Ctrl+C stops the daemon, which then shuts the workers down
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import cli, main
+    from PIL import PngImagePlugin, JpegImagePlugin
+
+def _startExecutor(workers: int):
+    """ Returns a pool of worker processes that have all started and imported everything """
+    from concurrent.futures import ProcessPoolExecutor
+    # the first tasks make the pool start all workers
+    executor = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker)
+    for future in [executor.submit(os.getpid) for _ in range(workers)]: future.result()
+    return executor
+
+def _runRequest(message: dict) -> dict:
+    """ Runs one request in a worker process """
+    from contextlib import redirect_stdout, redirect_stderr
+    from io import StringIO
+    os.chdir(message.get("cwd", os.getcwd()))
+
+    if "job" in message:
+        from batch import runJob
+        return runJob(message["job"])
+
+    # the variables the client did not set are not inherited from the daemon either
+    for name in CLIENT_VARIABLES: os.environ.pop(name, None)
+    os.environ.update({name: value for name, value in message.get("env", {}).items() if name in CLIENT_VARIABLES})
+
+    # the app prints its output and exits, both are captured for the client
+    from cli import App
+    stdout, stderr, exitCode = StringIO(), StringIO(), 0
+    with redirect_stdout(stdout), redirect_stderr(stderr):
+        try: App(message["argv"])
+        except SystemExit as e: exitCode = e.code if type(e.code) is int else (0 if e.code is None else 1)
+    return {"exitCode": exitCode, "stdout": stdout.getvalue(), "stderr": stderr.getvalue()}
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    def handle(self) -> None:
+        line = self.rfile.readline()
+        if line.strip() == b"": return      # a client that only checked whether the daemon is running
+        try:
+            message = json.loads(line)
+            if not isinstance(message, dict) or ("argv" not in message and "job" not in message):
+                raise ValueError("Request should be an object with argv or job")
+            if self.server.token is not None and not hmac.compare_digest(str(message.get("token", "")), self.server.token):
+                raise ValueError("The request does not have the secret of the daemon")
+            self.wfile.write(b'{"accepted": true}\n')
+            self.wfile.flush()
+            response = self.__run(message)
+        except Exception as e:
+            response = {"error": 3, "description": str(e)}
+        self.wfile.write(json.dumps(response).encode("utf-8") + b"\n")
+
+    def __run(self, message: dict) -> dict:
+        from concurrent.futures.process import BrokenProcessPool
+        executor = self.server.executor
+        try: return executor.submit(_runRequest, message).result()
+        except BrokenProcessPool:
+            # a worker died, for example of running out of memory, the pool is replaced once for the following requests
+            with self.server.executorLock:
+                if self.server.executor is executor:
+                    executor.shutdown(wait=False)
+                    self.server.executor = _startExecutor(self.server.workers)
+            raise
+
+
+class DaemonApp:
+    def __init__(self, arguments: list = None) -> None:
+        self.__parseArguments(arguments)
+        address = self.__args["address"]
+        if self.__isRunning(address):
+            print(f"A daemon is already listening on {address}")
+            exit(1)
+
+        # every worker imports Pillow and imgwriter once at start
+        executor = _startExecutor(self.__args["j"])
+        server = self.__createServer(address)
+        server.executor, server.executorLock, server.workers = executor, Lock(), self.__args["j"]
+        server.token = self.__writeToken(address) if _isPort(address) else None
+        print(f"Listening on {address} with {self.__args['j']} workers, press Ctrl+C to stop", flush=True)
+        try: server.serve_forever()
+        except KeyboardInterrupt: pass
+        finally:
+            server.server_close()
+            server.executor.shutdown()
+            if not _isPort(address) and os.path.exists(address): os.remove(address)
+            if _isPort(address) and os.path.exists(_tokenPath(address)): os.remove(_tokenPath(address))
+
+    def __parseArguments(self, arguments: list) -> None:
+        desc = os.linesep.join([
+            "Keep Pillow and imgwriter loaded in worker processes and run cli.py invocations in them",
+            "While the daemon is running, cli.py forwards every invocation to it and prints the same output",
+            f"The address can also be set with the {ADDRESS_VARIABLE} environment variable"
+        ])
+        parser = argparse.ArgumentParser(prog="cli.py daemon", description=desc, formatter_class=argparse.RawDescriptionHelpFormatter)
+        parser.add_argument("-j", metavar="WORKERS", type=int, default=os.cpu_count(), help="Number of worker processes")
+        parser.add_argument("-a", metavar="ADDRESS", dest="address", default=defaultAddress(),
+            help=f"Unix socket path or localhost port number to listen on (default {defaultAddress()})")
+        self.__args = vars(parser.parse_args(arguments))
+        if self.__args["j"] < 1:
+            parser.error("there must be at least one worker")
+
+    def __isRunning(self, address: str) -> bool:
+        if not _isPort(address) and not os.path.exists(address): return False
+        try: _connect(address).close()
+        except OSError:
+            # a socket file left behind by a daemon that did not stop cleanly
+            if not _isPort(address): os.remove(address)
+            return False
+        return True
+
+    def __writeToken(self, address: str) -> str:
+        """ Returns a new secret that clients must send, written to a file only the user of the daemon can read """
+        token = secrets.token_hex(32)
+        if os.path.exists(_tokenPath(address)): os.remove(_tokenPath(address))
+        # the file is created with its permissions, so it is never readable by others
+        with os.fdopen(os.open(_tokenPath(address), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as file: file.write(token)
+        return token
+
+    def __createServer(self, address: str) -> socketserver.BaseServer:
+        if _isPort(address):
+            # only local clients can connect
+            return socketserver.ThreadingTCPServer(("127.0.0.1", int(address)), _RequestHandler)
+
+        # the socket is accessible only to the user who started the daemon
+        oldMask = os.umask(0o177)
+        try: return socketserver.ThreadingUnixStreamServer(address, _RequestHandler)
+        finally: os.umask(oldMask)
@@ -0,0 +1,55 @@
+"""
+
+imgwriter / digests.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+from hashlib import sha256
+
+# the stored payload is hashed in chunks of this many bytes, a divisor of main.CHUNK_SIZE
+DIGEST_CHUNK_SIZE = 64*1024
+DIGEST_LENGTH = 32
+
+
+def digestTableLength(storedLength: int, chunkSize: int) -> int:
+    """ Returns the number of bytes in the digest table of a stored payload """
+    return -(-storedLength // chunkSize) * DIGEST_LENGTH
+
+def chunkDigests(data, chunkSize: int) -> list:
+    """ Returns the sha256 digests of every chunkSize bytes of the data, the last chunk may be shorter """
+    dataView = memoryview(data)
+    return [sha256(dataView[i:i+chunkSize]).digest() for i in range(0, len(data), chunkSize)]
+
+def tableDigests(table: bytes, firstChunk: int, count: int) -> list:
+    """ Returns count digests from the digest table starting from chunk index firstChunk """
+    return [table[i*DIGEST_LENGTH:(i+1)*DIGEST_LENGTH] for i in range(firstChunk, firstChunk+count)]
+
+
+class DigestBuilder:
+    def __init__(self, chunkSize: int) -> None:
+        """ Builds the digest table of data that is given in pieces of any length """
+        self.__chunkSize = chunkSize
+        self.__table = bytearray()
+        self.__checksum, self.__checksumLength = sha256(), 0
+
+    def update(self, data) -> None:
+        dataView, i = memoryview(data), 0
+        while i < len(dataView):
+            piece = dataView[i:i+self.__chunkSize-self.__checksumLength]
+            self.__checksum.update(piece)
+            self.__checksumLength += len(piece)
+            i += len(piece)
+            if self.__checksumLength == self.__chunkSize: self.__finishChunk()
+
+    def __finishChunk(self) -> None:
+        self.__table += self.__checksum.digest()
+        self.__checksum, self.__checksumLength = sha256(), 0
+
+    def table(self) -> bytes:
+        """ Returns the digests of every chunk, call after the last piece of data """
+        if self.__checksumLength > 0: self.__finishChunk()
+        return bytes(self.__table)
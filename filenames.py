@@ -0,0 +1,35 @@
+"""
+
+imgwriter / filenames.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+# only the standard library is needed here, so that cli.py can import it without Pillow
+import os
+
+
+def extractFileExtension(path: str) -> str:
+    """ returns the file extension of the path, or None if such doesn't exist """
+    filename = os.path.split(path)[1]
+    if "." not in filename or filename.rfind(".") == 0: return None
+    return filename.split(".")[-1]
+
+def addFileNameComponent(filename: str, component: str) -> str:
+    """
+    Adds a component to the end of the filename
+    Example: "test.png" + "foobar" -> "test.foobar.png"
+    """
+    path, file = os.path.split(filename)
+    if "." in file: file = ".".join(file.split(".")[:-1]) + "." + component + "." + file.split(".")[-1]
+    else: file += "_" + component
+    return os.path.join(path, file)
+
+def hasFileNameComponent(filename: str, component: str) -> bool:
+    """ Returns whether the filename looks like one returned by addFileNameComponent with the component """
+    file = os.path.split(filename)[1]
+    if "." in file: return file.split(".")[-2:-1] == [component] and file.count(".") >= 2
+    return file.endswith("_" + component)
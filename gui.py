@@ -9,12 +9,15 @@ File created on 2022-08-20
 """
 
 from tkinter import Tk, Label, Entry, StringVar, Button, Radiobutton, scrolledtext, WORD, Frame, Checkbutton, IntVar, INSERT, Message, PhotoImage
-from tkinter.ttk import Notebook
+from tkinter.ttk import Notebook, Progressbar
 from tkinter.filedialog import askopenfilename, asksaveasfilename
 from tkinter.messagebox import showerror, showinfo
 import main
-from main import Writer, Reader
+from main import Writer, Reader, Cancelled
+from filenames import extractFileExtension
 import os
+from pathlib import Path
+from threading import Thread, Event
 
 class GUI(Tk):
     def __init__(self) -> None:
@@ -58,7 +61,10 @@ class WriteView(Frame):
         self.__exifSelection = IntVar()
         Checkbutton(self, text="Modify EXIF", variable=self.__exifSelection, onvalue=1, offvalue=0).grid(column=0, row=3, columnspan=2)
 
-        Button(self, text="Run", command=self.__submit).grid(column=0, row=4, columnspan=2)
+        self.__runButton = Button(self, text="Run", command=self.__submit)
+        self.__runButton.grid(column=0, row=4, columnspan=2)
+        self.__jobWidget = JobWidget(self)
+        self.__jobWidget.grid(column=0, row=5, columnspan=2)
     
     def __payloadTypeChanged(self, *args) -> None:
         if self.__payloadTypeTextvar.get() == "plain":
@@ -68,12 +74,6 @@ class WriteView(Frame):
             self.__payloadFileInput.grid(column=0, row=2, columnspan=2)
             self.__plainTextInput.grid_remove()
     
-    def __extractFileExtension(self, path: str) -> str:
-        """ returns the file extension of the path, or None is such doesn't exist """
-        filename = os.path.split(path)[1]
-        if "." not in filename or filename.rfind(".") == 0: return None
-        return filename.split(".")[-1]
-
     def __submit(self) -> None:
         # get input image
         imageFile = self.__imageInput.filename
@@ -95,32 +95,35 @@ class WriteView(Frame):
             if "/" not in self.__payloadFileInput.filename:
                 showerror("No payload file", "Please select a payload file first")
                 return
-            try:
-                with open(self.__payloadFileInput.filename, "rb") as file:
-                    payload = file.read()
-            except FileNotFoundError:
+            payload = Path(self.__payloadFileInput.filename)
+            if not payload.exists():
                 showerror("File not found", f"Payload file {self.__payloadFileInput.filename} not found")
                 return
-            dataType = self.__extractFileExtension(self.__payloadFileInput.filename)
+            dataType = extractFileExtension(self.__payloadFileInput.filename)
         
         # get exif selection
         addExif = self.__exifSelection.get() == 1
 
-        # perform writing
-        try:
-            writer = Writer(imageFile, payload, dataType)
-        except Exception as e:
-            showerror("An error occurred", f"An error occurred during the process:{os.linesep}{e}")
-            return
-        
-        # save the output
+        # choose the output before the work starts so that it can run in the background
         pngFileType = ("PNG image file", "*.png")
         filename = asksaveasfilename(filetypes=[pngFileType], defaultextension=[pngFileType])
         if filename == "": return
         if not filename.lower().endswith(".png"):
             showerror("Not a PNG file", "Please save the output image as PNG")
             return
-        writer.save(filename, addExif)
+
+        # perform writing and save the output
+        def job(progress) -> None:
+            Writer(imageFile, payload, dataType, progress=progress).save(filename, addExif)
+        self.__runButton.configure(state="disabled")
+        self.__jobWidget.run(job, lambda result, error: self.__writingFinished(filename, error))
+
+    def __writingFinished(self, filename: str, error: Exception) -> None:
+        self.__runButton.configure(state="normal")
+        if isinstance(error, Cancelled): return
+        if error is not None:
+            showerror("An error occurred", f"An error occurred during the process:{os.linesep}{error}")
+            return
         showinfo("File saved", f"Image has been saved to {filename}")
 
 
@@ -131,12 +134,18 @@ class ReadView(Frame):
         self.__imageInput = FileWidget(self, "Image file:", ("PNG image file", "*.png"))
         self.__imageInput.grid(column=0, row=0, columnspan=2)
 
-        Button(self, text="Read to text", command=self.__readText).grid(column=0, row=1)
-        Button(self, text="Read to file", command=self.__readFile).grid(column=1, row=1)
+        self.__readButtons = [
+            Button(self, text="Read to text", command=self.__readText),
+            Button(self, text="Read to file", command=self.__readFile)
+        ]
+        for column, button in enumerate(self.__readButtons): button.grid(column=column, row=1)
 
         self.__plainTextOutput = scrolledtext.ScrolledText(self, wrap=WORD, width=30, height=10)
         self.__plainTextOutput.grid(column=0, row=2, columnspan=2)
         self.__setPlainTextOutput("")       # disable textfield
+
+        self.__jobWidget = JobWidget(self)
+        self.__jobWidget.grid(column=0, row=3, columnspan=2)
     
     def __setPlainTextOutput(self, value: str) -> None:
         self.__plainTextOutput.configure(state="normal")
@@ -144,6 +153,7 @@ class ReadView(Frame):
         self.__plainTextOutput.configure(state="disabled")
     
     def __performRead(self) -> Reader:
+        """ Reads only the header of the image, the payload is read with __startReading """
         # get image
         imageFilename = self.__imageInput.filename
         if "/" not in imageFilename:
@@ -153,17 +163,33 @@ class ReadView(Frame):
             showerror("File not found", f"Image file {imageFilename} not found")
             return None
         try:
-            return Reader(imageFilename)
+            return Reader(imageFilename, readPayload=False)
         except Exception as e:
             showerror("Error occurred", f"An error occurred during the process:{os.linesep}{e}")
 
+    def __startReading(self, output, onSuccess) -> None:
+        """ Reads the payload in the background, into memory or to the output path, and passes it to onSuccess """
+        imageFilename = self.__imageInput.filename
+        def job(progress) -> bytearray:
+            return Reader(imageFilename, output=output, progress=progress).payloadBinary
+        for button in self.__readButtons: button.configure(state="disabled")
+        self.__jobWidget.run(job, lambda payload, error: self.__readingFinished(payload, error, onSuccess))
+
+    def __readingFinished(self, payload: bytearray, error: Exception, onSuccess) -> None:
+        for button in self.__readButtons: button.configure(state="normal")
+        if isinstance(error, Cancelled): return
+        if error is not None:
+            showerror("Error occurred", f"An error occurred during the process:{os.linesep}{error}")
+            return
+        onSuccess(payload)
+
     def __readText(self) -> None:
         reader = self.__performRead()
         if reader == None: return
-        self.__setPlainTextOutput(reader.payloadBinary.decode("utf-8"))
+        self.__startReading(None, lambda payload: self.__setPlainTextOutput(payload.decode("utf-8")))
 
     def __readFile(self) -> None:
-        # perform the reading
+        # read the data type first to suggest it for the output
         reader = self.__performRead()
         if reader == None: return
 
@@ -172,9 +198,7 @@ class ReadView(Frame):
         fileTypeOption = [("Original file type", f"*.{reader.dataType}"), ("All files", "*.*")]
         filename = asksaveasfilename(filetypes=fileTypeOption, defaultextension=fileTypeOption)
         if filename == "": return
-        with open(filename, "wb") as file:
-            file.write(reader.payloadBinary)
-        showinfo("File saved", f"Image contents have been saved to {filename}")
+        self.__startReading(filename, lambda payload: showinfo("File saved", f"Image contents have been saved to {filename}"))
 
 
 class InfoView(Frame):
@@ -194,6 +218,54 @@ class InfoView(Frame):
         Message(self, text=os.linesep.join(infoText), width=300).grid(column=0, row=2)
 
 
+class JobWidget(Frame):
+    def __init__(self, root, **kw) -> None:
+        """ Shows the progress of a job running on a worker thread and lets the user cancel it """
+        super().__init__(root, **kw)
+        self.__thread = None
+        self.__progressbar = Progressbar(self, length=200, maximum=1.0)
+        self.__progressbar.grid(column=0, row=0)
+        self.__cancelButton = Button(self, text="Cancel", command=self.__cancel, state="disabled")
+        self.__cancelButton.grid(column=1, row=0)
+
+    def run(self, job, onFinish) -> None:
+        """
+        Runs job(progress) on a worker thread, progress should be passed on to Writer or Reader
+        onFinish(result, error) is called on the main thread when the job has returned or raised
+        """
+        if self.__thread is not None: return
+        self.__cancelled, self.__progress, self.__outcome = Event(), (0, None), (None, None)
+        self.__cancelButton.configure(state="normal")
+        self.__thread = Thread(target=self.__work, args=(job,), daemon=True)
+        self.__thread.start()
+        self.after(100, self.__poll, onFinish)
+
+    def __work(self, job) -> None:
+        # widgets must not be touched from this thread
+        try: self.__outcome = (job(self.__reportProgress), None)
+        except Exception as e: self.__outcome = (None, e)
+
+    def __reportProgress(self, processedBytes: int, totalBytes: int) -> bool:
+        self.__progress = (processedBytes, totalBytes)
+        return not self.__cancelled.is_set()
+
+    def __cancel(self) -> None:
+        self.__cancelled.set()
+        self.__cancelButton.configure(state="disabled")
+
+    def __poll(self, onFinish) -> None:
+        """ Updates the progress bar on the main thread until the job is done """
+        processedBytes, totalBytes = self.__progress
+        if totalBytes: self.__progressbar.configure(value=processedBytes/totalBytes)
+        if self.__thread.is_alive():
+            self.after(100, self.__poll, onFinish)
+            return
+        self.__thread = None
+        self.__cancelButton.configure(state="disabled")
+        self.__progressbar.configure(value=0)
+        onFinish(*self.__outcome)
+
+
 class FileWidget(Frame):
     def __init__(self, root, label, fileType: tuple[str, str] = ("All files", "*.*"), **kw) -> None:
         super().__init__(root, **kw)
@@ -0,0 +1,150 @@
+"""
+
+imgwriter / index.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+from main import probe
+from PIL import Image
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import os
+import sqlite3
+
+COLUMNS = ["path", "mtime", "size", "version", "dataType", "payloadLength", "checksum", "freeCapacity", "error"]
+
+
+def _probeFile(path: str) -> dict:
+    """ Returns the index row of one image file, images without data get their capacity for writing """
+    row = {"version": None, "dataType": None, "payloadLength": None, "checksum": None, "freeCapacity": None, "error": None}
+    try:
+        try: info = probe(path)
+        except ValueError as e:
+            # only an unknown version byte means that there is no data, other failures such as a corrupted header are errors
+            if not str(e).startswith("Unexpected protocol version"): raise
+            # only the size of an image without data is needed, its pixels are not decoded
+            with Image.open(path) as image: row["freeCapacity"] = max(0, image.width*image.height - 51)
+        else: row.update({name: info[name] for name in ["version", "dataType", "payloadLength", "checksum", "freeCapacity"]})
+    except Exception as e:
+        row["error"] = str(e)
+    return row
+
+
+class ImageIndex:
+    def __init__(self, database: str) -> None:
+        """ SQLite index of the headers of the images in directory trees, see update and find """
+        self.__connection = sqlite3.connect(database, timeout=30)
+        with self.__connection:
+            self.__connection.execute("""CREATE TABLE IF NOT EXISTS images (
+                path TEXT PRIMARY KEY, mtime INTEGER, size INTEGER, version INTEGER, dataType TEXT,
+                payloadLength INTEGER, checksum TEXT, freeCapacity INTEGER, error TEXT)""")
+            self.__connection.execute("CREATE INDEX IF NOT EXISTS imagesByFreeCapacity ON images (freeCapacity)")
+
+    def close(self) -> None:
+        self.__connection.close()
+
+    def __findImages(self, root: str) -> dict:
+        """ Returns the modification time and size of every file with an image extension under the root by its absolute path """
+        extensions = Image.registered_extensions()
+        images = {}
+        for directory, _, filenames in os.walk(root):
+            for filename in filenames:
+                if os.path.splitext(filename)[1].lower() not in extensions: continue
+                path = os.path.abspath(os.path.join(directory, filename))
+                try: status = os.stat(path)
+                except FileNotFoundError: continue
+                images[path] = (status.st_mtime_ns, status.st_size)
+        return images
+
+    def update(self, roots: list, workers: int = None) -> dict:
+        """
+        Probes the images under the root directories that are new or whose modification time or size changed,
+        and removes the images that no longer exist, returns the number of probed, unchanged and removed images
+        param workers is the number of processes to probe with, by default the number of processors
+        """
+        images = {}
+        for root in roots: images.update(self.__findImages(root))
+        known = {}
+        for root in roots:
+            # the trailing separator keeps /a/b from matching /a/bc
+            prefix = os.path.join(os.path.abspath(root), "")
+            rows = self.__connection.execute("SELECT path, mtime, size FROM images WHERE substr(path, 1, ?) = ?", (len(prefix), prefix))
+            known.update({path: (mtime, size) for path, mtime, size in rows})
+        changedPaths = [path for path, status in images.items() if known.get(path) != status]
+        removedPaths = [path for path in known if path not in images]
+
+        with ProcessPoolExecutor(max_workers=workers) as executor, self.__connection:
+            self.__connection.executemany("DELETE FROM images WHERE path = ?", [(path,) for path in removedPaths])
+            for path, row in zip(changedPaths, executor.map(_probeFile, changedPaths, chunksize=16)):
+                mtime, size = images[path]
+                self.__connection.execute(f"INSERT OR REPLACE INTO images ({', '.join(COLUMNS)}) VALUES ({', '.join('?'*len(COLUMNS))})",
+                    (path, mtime, size, *[row[column] for column in COLUMNS[3:]]))
+        return {"probed": len(changedPaths), "unchanged": len(images) - len(changedPaths), "removed": len(removedPaths)}
+
+    def find(self, minFreeCapacity: int = None, dataType: str = None, carriersOnly: bool = False, limit: int = None) -> list:
+        """
+        Returns the indexed images as dicts of COLUMNS
+        param minFreeCapacity picks the images without data with room for at least this many bytes, the ones with the least room first
+        images holding data are left out, as writing always starts from the first pixel and would overwrite their data
+        param dataType picks the images holding data of this type, carriersOnly the images holding any data
+        """
+        conditions, parameters = ["error IS NULL"], []
+        if minFreeCapacity is not None:
+            conditions.append("version IS NULL AND freeCapacity >= ?")
+            parameters.append(minFreeCapacity)
+        if dataType is not None:
+            conditions.append("dataType = ?")
+            parameters.append(dataType)
+        if carriersOnly: conditions.append("version IS NOT NULL")
+        query = f"SELECT {', '.join(COLUMNS)} FROM images WHERE {' AND '.join(conditions)}"
+        query += " ORDER BY freeCapacity, path" if minFreeCapacity is not None else " ORDER BY path"
+        if limit is not None:
+            query += " LIMIT ?"
+            parameters.append(limit)
+        return [dict(zip(COLUMNS, row)) for row in self.__connection.execute(query, parameters)]
+
+
+class IndexApp:
+    def __init__(self, arguments: list = None) -> None:
+        self.__parseArguments(arguments)
+        index = ImageIndex(self.__args["database"])
+        try:
+            if len(self.__args["roots"]) > 0:
+                print(json.dumps(index.update(self.__args["roots"], self.__args["j"])), flush=True)
+            if self.__isQuery():
+                for row in index.find(self.__args["free"], self.__args["type"], self.__args["carriers"], self.__args["limit"]):
+                    print(json.dumps(row))
+        finally:
+            index.close()
+
+    def __parseArguments(self, arguments: list) -> None:
+        desc = os.linesep.join([
+            "Keep a SQLite database of the images in directory trees and the data stored in them",
+            "Only new and changed images are read again, and only their headers are decoded",
+            "Queries print one JSON line per image, for example --free 100000 lists the empty images where 100 kB of data fits"
+        ])
+        parser = argparse.ArgumentParser(prog="cli.py index", description=desc, formatter_class=argparse.RawDescriptionHelpFormatter)
+
+        parser.add_argument("database", help="Path of the SQLite database, created if it does not exist")
+        parser.add_argument("roots", metavar="DIR", nargs="*", help="Directories to scan for images")
+        parser.add_argument("-j", metavar="WORKERS", type=int, default=os.cpu_count(), help="Number of worker processes")
+
+        # queries
+        parser.add_argument("--free", metavar="BYTES", type=int, help="List the images without data that have room for this many bytes")
+        parser.add_argument("--type", metavar="TYPE", help="List the images holding data of this type")
+        parser.add_argument("--carriers", action="store_true", help="List the images holding any data")
+        parser.add_argument("--limit", metavar="COUNT", type=int, help="List at most this many images")
+
+        self.__args = vars(parser.parse_args(arguments))
+        if self.__args["j"] < 1:
+            parser.error("there must be at least one worker")
+        if len(self.__args["roots"]) == 0 and not self.__isQuery():
+            parser.error("pass directories to scan or a query")
+
+    def __isQuery(self) -> bool:
+        return self.__args["free"] is not None or self.__args["type"] is not None or self.__args["carriers"] == True
@@ -10,192 +10,998 @@ File created on 2022-08-20
 
 __author__ = "Pyry Lahtinen"
 __author_email__ = "contact@pyry.info"
-__version__ = "1.0.1"
+from version import __version__
 
-from PIL import Image, ExifTags
-from math import floor, ceil
-from random import choice
+from PIL import Image, PngImagePlugin
 from hashlib import sha256
+from functools import lru_cache
+from codec import createCodec, PROFILES, PROFILE_IDS, PROFILE_NAMES, bytesPerPixel
+from compressors import CODECS, CODEC_NAMES, compressor, decompressChunks
+from parallel import BandPool
+from digests import DIGEST_CHUNK_SIZE, DigestBuilder, digestTableLength, chunkDigests, tableDigests
+from typing import NamedTuple
+from contextlib import contextmanager, nullcontext, ExitStack
+from time import perf_counter
+from concurrent.futures import Future
+from threading import Thread
+from io import BytesIO
+import os
+
+# payloads are streamed into the image in chunks of this many bytes, a multiple of the bytes per pixel of every density profile
+CHUNK_SIZE = 1024*1024
+
+# tags of the header options, any option makes the image use protocol version 2
+OPTION_SHARD = 1
+OPTION_COMPRESSION = 2
+OPTION_DENSITY = 3
+OPTION_CONTAINER = 4
+OPTION_DIGESTS = 5
+
+# save profiles as the image format and Pillow's save options, format None takes the format from the file extension
+SAVE_PROFILES = {
+    "default": (None, {}),
+    "fast": ("PNG", {"compress_level": 1}),
+    "small": ("PNG", {"optimize": True}),
+    "webp": ("WEBP", {}),
+    "tiff": ("TIFF", {"compression": "tiff_adobe_deflate"})
+}
+# formats that keep every pixel value intact, with the options needed for it, other formats would destroy the payload
+LOSSLESS_FORMATS = {"PNG": {}, "WEBP": {"lossless": True, "exact": True}, "TIFF": {}, "BMP": {}}
+# lossless formats that save only the color channels, the alpha channel of RGBA images would be dropped
+OPAQUE_FORMATS = ["BMP"]
+
+
+class Shard(NamedTuple):
+    """ Position of one image's payload within a payload split across several images """
+    index: int
+    count: int
+    offset: int
+    payloadLength: int
+    checksum: bytes     # sha256 of the whole payload
+
+    def toBytes(self) -> bytes:
+        return (self.index.to_bytes(2, "big") + self.count.to_bytes(2, "big") + self.offset.to_bytes(8, "big")
+            + self.payloadLength.to_bytes(8, "big") + self.checksum)
+
+    @classmethod
+    def fromBytes(cls, value: bytes):
+        if len(value) != 52: raise ValueError("Invalid shard option in header")
+        return cls(int.from_bytes(value[0:2], "big"), int.from_bytes(value[2:4], "big"), int.from_bytes(value[4:12], "big"),
+            int.from_bytes(value[12:20], "big"), bytes(value[20:52]))
+
+
+class Member(NamedTuple):
+    """ Position of one named member within the payload of a container, see Reader.readMember """
+    name: str
+    offset: int         # from the start of the payload
+    length: int
+    checksum: bytes     # sha256 of the member
+
+
+def _checkMemberName(name) -> None:
+    if type(name) is not str or name in ["", ".", ".."] or "/" in name or "\\" in name or len(name.encode("utf-8")) > 0xffff:
+        raise ValueError(f"Invalid member name {name!r}")
+
+def _packDirectory(members: list) -> bytes:
+    """ Returns the directory of a container as the member count and name, offset, length and checksum of every member """
+    directory = bytearray(len(members).to_bytes(4, "big"))
+    for member in members:
+        nameBytes = member.name.encode("utf-8")
+        directory += len(nameBytes).to_bytes(2, "big") + nameBytes
+        directory += member.offset.to_bytes(8, "big") + member.length.to_bytes(8, "big") + member.checksum
+    return bytes(directory)
+
+def _unpackDirectory(directory: bytes) -> list:
+    members, i = [], 4
+    for _ in range(int.from_bytes(directory[0:4], "big")):
+        nameLength = int.from_bytes(directory[i:i+2], "big")
+        if i+2+nameLength+48 > len(directory): raise ValueError("Invalid container directory")
+        try: name = directory[i+2:i+2+nameLength].decode("utf-8")
+        except UnicodeDecodeError: raise ValueError("Invalid container directory")
+        _checkMemberName(name)
+        i += 2 + nameLength
+        members.append(Member(name, int.from_bytes(directory[i:i+8], "big"), int.from_bytes(directory[i+8:i+16], "big"),
+            bytes(directory[i+16:i+48])))
+        i += 48
+    if i != len(directory): raise ValueError("Invalid container directory")
+    return members
+
+
+@lru_cache(maxsize=None)
+def _exifTagCodes() -> dict:
+    """ Returns the numeric codes of the EXIF tags by their names, the table is built only once """
+    from PIL import ExifTags
+    return {tagName: code for code, tagName in ExifTags.TAGS.items()}
+
+
+def checkWorkers(workers: int) -> int:
+    """ Returns the number of worker processes, 1 if workers is None, and raises ValueError if it is not a positive integer """
+    if workers is None: return 1
+    if type(workers) is not int or workers < 1:
+        raise ValueError(f"Parameter workers should be a positive integer, but {workers!r} was given")
+    return workers
+
+
+class Cancelled(Exception):
+    """ Raised by Writer and Reader when their progress callback returns False """
+
+
+class Stats:
+    def __init__(self, hook = None) -> None:
+        """
+        Collects the wall time, byte count and pixel count of every phase of Writer or Reader
+        param hook is called as hook(phase, seconds, byteCount, pixelCount) after every measured step
+        """
+        self.__phases = {}
+        self.__hook = hook
+        self.__childTimes = []      # time spent in nested phases of the running phases
+
+    @contextmanager
+    def measure(self, phase: str):
+        """ Measures the time of the with block, excluding nested phases, and yields a dict for byte and pixel counts """
+        counts = {"bytes": 0, "pixels": 0}
+        self.__childTimes.append(0.0)
+        startTime = perf_counter()
+        try:
+            yield counts
+        finally:
+            elapsedTime = perf_counter() - startTime
+            seconds = elapsedTime - self.__childTimes.pop()
+            if len(self.__childTimes) > 0: self.__childTimes[-1] += elapsedTime
+            self.__record(phase, seconds, counts["bytes"], counts["pixels"])
+
+    def __record(self, phase: str, seconds: float, byteCount: int, pixelCount: int) -> None:
+        totals = self.__phases.setdefault(phase, {"seconds": 0.0, "bytes": 0, "pixels": 0, "steps": 0})
+        totals["seconds"] += seconds
+        totals["bytes"] += byteCount
+        totals["pixels"] += pixelCount
+        totals["steps"] += 1
+        if self.__hook is not None: self.__hook(phase, seconds, byteCount, pixelCount)
+
+    @property
+    def phases(self) -> dict:
+        """ Totals of every phase in the order they started, with throughput in MB/s """
+        phases = {}
+        for phase, totals in self.__phases.items():
+            throughput = totals["bytes"] / totals["seconds"] / 1e6 if totals["seconds"] > 0 else None
+            phases[phase] = {**totals, "MBps": throughput}
+        return phases
+
+    @property
+    def totalSeconds(self) -> float:
+        return sum(totals["seconds"] for totals in self.__phases.values())
+
+
+def _measure(stats: Stats, phase: str):
+    return nullcontext({}) if stats is None else stats.measure(phase)
+
+def _measureChunks(stats: Stats, phase: str, chunks):
+    """ Yields the chunks and measures the time taken to produce each of them """
+    chunks = iter(chunks)
+    while True:
+        with _measure(stats, phase) as counts:
+            chunk = next(chunks, None)
+            counts["bytes"] = 0 if chunk is None else len(chunk)
+        if chunk is None: return
+        yield chunk
+
+def _reportChunks(progress, chunks, totalLength: int, action: str):
+    """ Yields the chunks and reports the progress after each of them has been processed """
+    processedLength = 0
+    _reportProgress(progress, processedLength, totalLength, action)
+    for chunk in chunks:
+        yield chunk
+        processedLength += len(chunk)
+        _reportProgress(progress, processedLength, totalLength, action)
+
+def _reportProgress(progress, processedLength: int, totalLength: int, action: str) -> None:
+    if progress is not None and progress(processedLength, totalLength) == False:
+        raise Cancelled(f"{action} was cancelled")
+
+def _openRows(image) -> Image.Image:
+    """
+    Opens an image file that is decoded only as far as needed, see Reader.__loadRows
+    PNG files over Image.MAX_IMAGE_PIXELS are accepted when their rows can be decoded partially, as the size then does not matter
+    """
+    try: return Image.open(image)
+    except Image.DecompressionBombError as error: bombError = error
+    if hasattr(image, "seek"): image.seek(0)
+    try: openedImage = PngImagePlugin.PngImageFile(image)
+    except SyntaxError: raise bombError from None
+    if openedImage.info.get("interlace") or len(openedImage.tile) != 1:
+        if type(image) is str: openedImage.close()
+        raise bombError
+    return openedImage
+
+def _openImage(image, stats: Stats, decode: bool) -> Image.Image:
+    """
+    Returns the image given to Writer or Reader as a path, a file or a Pillow image, and checks its color mode
+    param decode makes the pixels of files decoded at once, otherwise Pillow decodes them when they are first needed
+    """
+    if type(image) == str or hasattr(image, "read"):
+        with _measure(stats, "open") as counts:
+            openedImage = Image.open(image) if decode else _openRows(image)
+            if decode:
+                openedImage.load()
+                counts["pixels"] = openedImage.width*openedImage.height
+    elif isinstance(image, Image.Image): openedImage = image
+    else: raise ValueError(f"Parameter image should be string, file or Pillow image, but {type(image)} was given")
+
+    if openedImage.mode.lower() not in ["rgb", "rgba"]:
+        raise ValueError(f"The provided image is in unsupported mode {openedImage.mode}, RGB or RGBA is needed")
+    return openedImage
+
+def _checkDensity(density: str, image: Image.Image) -> None:
+    if len(PROFILES[density]) > len(image.getbands()):
+        raise ValueError(f"Density profile {density} needs an RGBA image, but {image.mode} was given")
 
 
 class Writer:
-    def __init__(self, image, payload: bytes, dataType: str) -> None:
+    def __init__(self, image, payload, dataType: str, shard: Shard = None, compression: str = None, density: str = "standard",
+            stats: Stats = None, progress = None, workers: int = None, digests: bool = False) -> None:
         """
-        param image should be string (path to file) or PIL.Image.Image
+        param image should be string (path to file), a seekable binary file-like object or PIL.Image.Image
+        param payload should be bytes, a binary file-like object or a path-like object
+        or a dict of such by member name to write a container of several members, see Reader.readMember
         param dataType is the file extension of the data
+        param shard tells the position of the payload when it is a part of a bigger one, see shard.py
+        param compression can be "none", "zlib", "bz2", "lzma" or "auto" to pick the one with the smallest output
+        param density is the profile of how many bits are stored per pixel, see codec.PROFILES
+        param stats can be given to measure the phases of writing
+        param progress is called as progress(processedBytes, totalBytes) while the payload is read, totalBytes is None if unknown
+        returning False from it stops writing and raises Cancelled, an image given as Pillow image is then left partially modified
+        param workers is the number of processes to encode the payload with, see parallel.py, by default it is encoded in this process
+        param digests can be set True to store a digest of every 64 KiB of the payload after it,
+        so that reading stops at the first corrupted chunk and Reader.verify can tell the intact parts
         """
+        self.__stats, self.__progress = stats, progress
+        self.__workers, self.__bandPool = checkWorkers(workers), None
+        self.__digests, self.__digestTable = DigestBuilder(DIGEST_CHUNK_SIZE) if digests else None, b""
 
         # load image
-        if type(image) == str: self.__image = Image.open(image)
-        elif isinstance(image, Image.Image): self.__image = image
-        else: raise ValueError(f"Parameter image should be string or Pillow image, but {type(image)} was given")
-
-        # check image color mode
-        if self.__image.mode.lower() not in ["rgb", "rgba"]:
-            raise ValueError(f"The provided image is in unsupported mode {self.__image.mode}, RGB or RGBA is needed")
+        self.__image = _openImage(image, stats, decode=True)
 
-        # prepare payload
-        if type(payload) is not bytes:
-            raise ValueError(f"Parameter payload should be string or bytes, but {type(payload)} was given")
+        # check payload and data type
+        if type(payload) not in [bytes, dict] and not hasattr(payload, "read") and not isinstance(payload, os.PathLike):
+            raise ValueError(f"Parameter payload should be bytes, file, path or dict, but {type(payload)} was given")
         if type(dataType) is not str:
             raise ValueError("Data type must be provided when payload is not string")
-        self.__payload = payload
+        self.__dataTypeBytes = self.__prepareDataType(dataType)
+
+        # check options
+        if shard is not None and not isinstance(shard, Shard):
+            raise ValueError(f"Parameter shard should be Shard, but {type(shard)} was given")
+        if compression not in [None, "none", "auto", *CODECS]:
+            raise ValueError(f"Unsupported compression {compression}, expected one of none, auto, {', '.join(CODECS)}")
+        self.__shard, self.__compression = shard, compression
+        self.__codec = CODECS.get(compression)
+        self.__originalLength = 0
+        if density not in PROFILES:
+            raise ValueError(f"Unsupported density profile {density}, expected one of {', '.join(PROFILES)}")
+        _checkDensity(density, self.__image)
+        self.__density, self.__bytesPerPixel = density, bytesPerPixel(density)
+
+        # members are located by their offsets in the stored payload, which compression would change
+        self.__directory = None
+        if type(payload) is dict and compression not in [None, "none"]:
+            raise ValueError("A container cannot be compressed")
+        if type(payload) is dict and shard is not None:
+            raise ValueError("A container cannot be split into shards")
+
+        # perform writing, the files opened here are closed afterwards
+        with ExitStack() as files:
+            if type(payload) is dict: payload = self.__prepareContainer(payload, files)
+            elif isinstance(payload, os.PathLike): payload = files.enter_context(open(payload, "rb"))
+            self.__write(payload)
+
+    def __prepareDataType(self, dataType: str) -> bytes:
+        dataTypeBytes = dataType.encode("utf-8")
+        if len(dataTypeBytes) > 10:
+            raise ValueError("Data type is too long to be encoded")
+        dataTypePadding = bytes(10 - len(dataTypeBytes))
+        return dataTypePadding + dataTypeBytes
+
+    def __prepareOptions(self) -> bytes:
+        """ Returns the header options as tag, length and value records """
+        options = bytearray()
+        if self.__shard is not None:
+            shardBytes = self.__shard.toBytes()
+            options += bytes([OPTION_SHARD, len(shardBytes)]) + shardBytes
+        if self.__codec is not None:
+            options += bytes([OPTION_COMPRESSION, 9, self.__codec]) + self.__originalLength.to_bytes(8, "big")
+        if self.__density != "standard":
+            options += bytes([OPTION_DENSITY, 1, PROFILE_IDS[self.__density]])
+        if self.__directory is not None:
+            options += bytes([OPTION_CONTAINER, 36]) + len(self.__directory).to_bytes(4, "big") + sha256(self.__directory).digest()
+        if self.__digests is not None:
+            options += bytes([OPTION_DIGESTS, 36]) + DIGEST_CHUNK_SIZE.to_bytes(4, "big") + sha256(self.__digestTable).digest()
+        return bytes(options)
+
+    def __checkPayloadLength(self, payloadLength: int) -> None:
+        if payloadLength.bit_length() > 80:
+            raise ValueError("Payload is too long")
+        payloadPixels = -(-payloadLength // self.__bytesPerPixel)
+        if self.__digests is not None:
+            payloadPixels += -(-digestTableLength(payloadLength, DIGEST_CHUNK_SIZE) // self.__bytesPerPixel)
+        if payloadPixels+self.__headerLength > self.__image.width*self.__image.height:
+            raise ValueError("The provided image is too small")
 
-        # perform writing
-        self.__prepareMessage(dataType)
-        self.__write()
-    
-    def __prepareMessage(self, dataType: str) -> None:
-        self.__message = bytearray()
+    def __prepareHeader(self, checksum: bytes, payloadLength: int) -> bytes:
+        header = bytearray()
 
         # protocol version
-        self.__message.append(0b1)
+        header.append(0b1 if self.__headerLength == 51 else 0b10)
 
         # sha256 checksum
-        self.__message += sha256(self.__payload).digest()
+        header += checksum
 
         # data type
-        dataTypeBytes = dataType.encode("utf-8")
-        if len(dataTypeBytes) > 10:
-            raise ValueError("Data type is too long to be encoded")
-        dataTypePadding = bytes(10 - len(dataTypeBytes))
-        self.__message += dataTypePadding + dataTypeBytes
+        header += self.__dataTypeBytes
 
         # payload length
-        payloadLength = len(self.__payload)
-        if payloadLength.bit_length() > 80:
-            raise ValueError("Payload is too long")
-        if payloadLength+51 > self.__image.width*self.__image.height:
+        header += payloadLength.to_bytes(8, "big")
+
+        # options of protocol version 2
+        options = self.__prepareOptions()
+        if len(options) > 0:
+            header += len(options).to_bytes(2, "big") + options
+        return bytes(header)
+
+    def __prepareContainer(self, members: dict, files: ExitStack) -> list:
+        """
+        Measures and hashes every member, and returns the directory and the members as the parts of the payload
+        Members in files are read twice, files that cannot be rewound are read into memory
+        """
+        if len(members) == 0:
+            raise ValueError("A container needs at least one member")
+        entries, parts = [], []
+        with _measure(self.__stats, "prepare") as counts:
+            for name, member in members.items():
+                _checkMemberName(name)
+                if isinstance(member, os.PathLike): member = files.enter_context(open(member, "rb"))
+                elif type(member) is not bytes and not hasattr(member, "read"):
+                    raise ValueError(f"Member {name} should be bytes, file or path, but {type(member)} was given")
+                if type(member) is not bytes and self.__measurePayload(member) is None:
+                    member = b"".join(self.__readChunks(member))
+
+                checksum, length = sha256(), 0
+                if type(member) is bytes: position = None
+                else: position = member.tell()
+                for chunk in self.__readChunks(member):
+                    checksum.update(chunk)
+                    length += len(chunk)
+                if position is not None: member.seek(position)
+                entries.append((name, length, checksum.digest()))
+                parts.append(member)
+            counts["bytes"] = sum(length for _, length, _ in entries)
+
+        # the directory is followed by the members in the same order
+        directoryLength = 4 + sum(2 + len(name.encode("utf-8")) + 48 for name, _, _ in entries)
+        offset, directory = directoryLength, []
+        for name, length, checksum in entries:
+            directory.append(Member(name, offset, length, checksum))
+            offset += length
+        self.__directory = _packDirectory(directory)
+        return [self.__directory, *parts]
+
+    def __measurePayload(self, payload) -> int:
+        """ Returns the number of bytes left in the payload, or None if it cannot be known beforehand """
+        if type(payload) is bytes: return len(payload)
+        if type(payload) is list:
+            lengths = [self.__measurePayload(part) for part in payload]
+            return None if None in lengths else sum(lengths)
+        try:
+            position = payload.tell()
+            payloadLength = payload.seek(0, os.SEEK_END) - position
+            payload.seek(position)
+            return payloadLength
+        except (AttributeError, OSError):
+            return None
+
+    def __readChunks(self, payload):
+        """ Yields the payload in chunks of at most CHUNK_SIZE bytes """
+        if type(payload) is list:
+            for part in payload: yield from self.__readChunks(part)
+            return
+        if type(payload) is bytes:
+            payloadView = memoryview(payload)
+            for i in range(0, len(payload), CHUNK_SIZE):
+                yield payloadView[i:i+CHUNK_SIZE]
+            return
+        while True:
+            chunk = payload.read(CHUNK_SIZE)
+            if type(chunk) is str:
+                raise ValueError("Payload file should be opened in binary mode")
+            if not chunk: return
+            yield chunk
+
+    def __alignChunks(self, chunks):
+        """ Yields the chunks so that each of them but the last one fills whole pixels """
+        remainder = b""
+        for chunk in chunks:
+            chunk = remainder + chunk if len(remainder) > 0 else chunk
+            alignedLength = len(chunk) - len(chunk) % self.__bytesPerPixel
+            remainder = bytes(chunk[alignedLength:])
+            if alignedLength > 0: yield chunk[:alignedLength]
+        if len(remainder) > 0: yield remainder
+
+    def __compressChunks(self, chunks):
+        """ Yields the compressed payload in chunks of about CHUNK_SIZE bytes """
+        payloadCompressor, buffer = compressor(self.__codec), bytearray()
+        for chunk in chunks:
+            self.__originalLength += len(chunk)
+            buffer += payloadCompressor.compress(chunk)
+            if len(buffer) >= CHUNK_SIZE:
+                yield bytes(buffer)
+                buffer.clear()
+        yield bytes(buffer + payloadCompressor.flush())
+
+    def __compressAuto(self, chunks):
+        """ Compresses the payload with every codec, chooses the smallest result and yields it in chunks """
+        imageCapacity = self.__image.width*self.__image.height*self.__bytesPerPixel
+        candidates = {None: [None, bytearray()], **{codecId: [compressor(codecId), bytearray()] for codecId in CODEC_NAMES}}
+        for chunk in chunks:
+            self.__originalLength += len(chunk)
+            for codecId, (candidateCompressor, buffer) in list(candidates.items()):
+                buffer += chunk if candidateCompressor is None else candidateCompressor.compress(chunk)
+                # results that cannot fit in the image are dropped to save memory
+                if len(buffer) > imageCapacity: del candidates[codecId]
+        for candidateCompressor, buffer in candidates.values():
+            if candidateCompressor is not None: buffer += candidateCompressor.flush()
+        if len(candidates) == 0:
             raise ValueError("The provided image is too small")
-        self.__message += payloadLength.to_bytes(8, "big")
-
-        # the payload itself
-        self.__message += self.__payload
-
-    def __modifyColor(self, color: int, targetMod: int) -> int:
-        """
-        color in range 0...255
-        targetMod in range 0...7
-        """
-        
-        # check that the color is 8-bit
-        if color < 0 or color > 255 or type(color) != int:
-            raise ValueError()
-        
-        # calculate the two nearest target mods
-        n = (color - targetMod) / 8
-        lowN, highN = floor(n), ceil(n)
-        lowerColor, higherColor = 8*lowN+targetMod, 8*highN+targetMod
-
-        # make decision
-        if lowerColor < 0: return higherColor
-        if higherColor > 255: return lowerColor
-        return choice([lowerColor, higherColor])
-    
-    def __modifyPixel(self, pixel: tuple[int], messageByte: int) -> tuple[int]:
-        # check that the byte is 8-bit
-        if messageByte < 0 or messageByte > 255 or type(messageByte) != int:
-            raise ValueError(f"Unexpected non-8-bit byte in message")
-
-        # split the 8-bit byte into three parts for R, G and B
-        messageBinary = f"{messageByte:08b}"        # str of eight ones and zeros
-        messageParts = int(messageBinary[0:3], 2), int(messageBinary[3:6], 2), int(messageBinary[6:], 2)    # all ints in 0...7
-
-        # modify the pixel colors
-        newR = self.__modifyColor(pixel[0], messageParts[0])
-        newG = self.__modifyColor(pixel[1], messageParts[1])
-        newB = self.__modifyColor(pixel[2], messageParts[2])
-
-        # return new pixel data
-        if len(pixel) == 4: return (newR, newG, newB, pixel[3])
-        return (newR, newG, newB)
-        
-    def __write(self) -> None:
-        imageWidth = self.__image.width
-        for i, messageByte in enumerate(self.__message):
-            x, y = i%imageWidth, i//imageWidth
-            oldPixel = self.__image.getpixel((x, y))
-            newPixel = self.__modifyPixel(oldPixel, messageByte)
-            self.__image.putpixel((x, y), newPixel)
+
+        # uncompressed wins ties as it is the first one
+        self.__codec = min(candidates, key=lambda codecId: len(candidates[codecId][1]))
+        return self.__readChunks(bytes(candidates[self.__codec][1]))
+
+    def __writeBytes(self, start: int, data, density: str = "standard") -> None:
+        """ Writes data bytes starting from pixel index start """
+        if self.__bandPool is not None:
+            self.__bandPool.encode(start, data, density, -(-len(data) // bytesPerPixel(density)))
+            return
+        # use the array-backed codec when NumPy is available, otherwise the lookup tables
+        createCodec(density).encode(self.__image, start, data)
+
+    def __write(self, payload) -> None:
+        # compress the payload on the fly, or try every codec when choosing automatically
+        payloadLength = self.__measurePayload(payload)
+        chunks = _reportChunks(self.__progress, self.__readChunks(payload), payloadLength, "Writing")
+        if self.__compression == "auto":
+            with _measure(self.__stats, "prepare"): chunks = self.__compressAuto(chunks)
+        elif self.__codec is not None:
+            chunks = self.__compressChunks(chunks)
+        optionsLength = len(self.__prepareOptions())
+        self.__headerLength = 51 if optionsLength == 0 else 53 + optionsLength
+
+        # check the capacity beforehand if the payload length is known
+        if payloadLength is not None and self.__codec is None: self.__checkPayloadLength(payloadLength)
+
+        # stream the payload into the pixels after the header, the chunks are encoded as bands in parallel if requested
+        useBands = self.__workers > 1 and (payloadLength is None or payloadLength > CHUNK_SIZE)
+        bandPool = BandPool(self.__image, self.__workers) if useBands else nullcontext()
+        with bandPool as self.__bandPool:
+            checksum, writtenLength = sha256(), 0
+            for chunk in _measureChunks(self.__stats, "prepare", self.__alignChunks(chunks)):
+                self.__checkPayloadLength(writtenLength + len(chunk))
+                with _measure(self.__stats, "checksum") as counts:
+                    checksum.update(chunk)
+                    if self.__digests is not None: self.__digests.update(chunk)
+                    counts["bytes"] = len(chunk)
+                with _measure(self.__stats, "encode") as counts:
+                    self.__writeBytes(self.__headerLength + writtenLength // self.__bytesPerPixel, chunk, self.__density)
+                    counts["bytes"], counts["pixels"] = len(chunk), -(-len(chunk) // self.__bytesPerPixel)
+                writtenLength += len(chunk)
+            if self.__codec is None: self.__originalLength = writtenLength
+
+            # the digest table starts from the pixel after the payload
+            if self.__digests is not None:
+                with _measure(self.__stats, "encode") as counts:
+                    self.__digestTable = self.__digests.table()
+                    self.__writeBytes(self.__headerLength + -(-writtenLength // self.__bytesPerPixel), self.__digestTable, self.__density)
+                    counts["bytes"], counts["pixels"] = len(self.__digestTable), -(-len(self.__digestTable) // self.__bytesPerPixel)
+
+            # the header is written last as it contains the checksum
+            with _measure(self.__stats, "encode") as counts:
+                header = self.__prepareHeader(checksum.digest(), writtenLength)
+                self.__writeBytes(0, header)
+                counts["bytes"] = counts["pixels"] = len(header)
+        self.__bandPool = None
     
     @property
     def image(self) -> Image.Image:
         """ The modified image with data in it """
         return self.__image
+
+    @property
+    def stats(self) -> Stats:
+        """ The measurements of the phases of writing and saving, or None if not requested """
+        return self.__stats
     
-    def save(self, path: str, addExif: bool = False) -> None:
-        """ Saves the modified image to provided path """
+    def save(self, path, addExif: bool = False, profile: str = "default", background: bool = False) -> Future:
+        """
+        Saves the modified image to provided path
+        param path can also be a writable binary file-like object, such as io.BytesIO, to encode the image in memory
+        param profile is one of SAVE_PROFILES, for example fast for quick PNG compression, small for the smallest PNG or webp and tiff for those formats
+        param background can be set True to save in a new thread, the image must not be modified before the returned future is done
+        Raises ValueError if the format would not keep the payload intact
+        """
+        imageFormat, options = self.__prepareSave(path, profile)
         exif = None
         if addExif:
-            processingSoftwareCode = list(ExifTags.TAGS.keys())[list(ExifTags.TAGS.values()).index("ProcessingSoftware")]
             exif = self.__image.getexif()
-            exif[processingSoftwareCode] = "ImgWriter 1.0"
-
-        self.__image.save(path, exif=exif)
+            exif[_exifTagCodes()["ProcessingSoftware"]] = "ImgWriter 1.0"
+        if exif is not None: options["exif"] = exif
+
+        def saveImage() -> None:
+            # stats are not thread-safe, so background saves are not measured
+            with _measure(self.__stats, "save") if not background else nullcontext({}) as counts:
+                # only the PNG encoder streams its output, the others may seek in it, so they are encoded in memory for pipes
+                if hasattr(path, "write") and imageFormat != "PNG" and not (hasattr(path, "seekable") and path.seekable()):
+                    encodedImage = BytesIO()
+                    self.__image.save(encodedImage, imageFormat, **options)
+                    path.write(encodedImage.getbuffer())
+                else: self.__image.save(path, imageFormat, **options)
+                counts["pixels"] = self.__image.width*self.__image.height
+        if not background:
+            saveImage()
+            return None
+
+        # the image encoders release the GIL, so the caller can do other work meanwhile
+        future = Future()
+        def saveInBackground() -> None:
+            if not future.set_running_or_notify_cancel(): return
+            try: saveImage()
+            except BaseException as e: future.set_exception(e)
+            else: future.set_result(None)
+        Thread(target=saveInBackground).start()
+        return future
+
+    def __prepareSave(self, path, profile: str) -> tuple:
+        """ Returns the image format and the save options of the profile, and checks that the format is lossless """
+        if profile not in SAVE_PROFILES:
+            raise ValueError(f"Unsupported save profile {profile}, expected one of {', '.join(SAVE_PROFILES)}")
+        imageFormat, options = SAVE_PROFILES[profile]
+
+        # without a format in the profile, it comes from the file extension like in Pillow
+        if imageFormat is None:
+            filename = os.fspath(path) if isinstance(path, (str, os.PathLike)) else getattr(path, "name", "")
+            extension = os.path.splitext(str(filename))[1].lower()
+            imageFormat = Image.registered_extensions().get(extension, "PNG" if extension == "" else None)
+            if imageFormat is None:
+                raise ValueError(f"Unknown image format of file extension '{extension}'")
+        if imageFormat not in LOSSLESS_FORMATS:
+            raise ValueError(f"Image format {imageFormat} would not keep the data intact, use one of {', '.join(LOSSLESS_FORMATS)}")
+        if imageFormat in OPAQUE_FORMATS and self.__image.mode.lower() == "rgba":
+            raise ValueError(f"Image format {imageFormat} would drop the alpha channel of the RGBA image, use another format")
+        return imageFormat, {**LOSSLESS_FORMATS[imageFormat], **options}
 
 
 class Reader:
-    def __init__(self, image) -> None:
+    def __init__(self, image, readPayload: bool = True, output = None, stats: Stats = None, progress = None, workers: int = None) -> None:
         """
-        param image should be string (path to file) or PIL.Image.Image
+        param image should be string (path to file), a seekable binary file-like object or PIL.Image.Image
+        param readPayload can be set False to read only the header
+        param output can be a path or a writable binary file-like object to stream the payload into instead of memory
+        param stats can be given to measure the phases of reading
+        param progress is called as progress(processedBytes, totalBytes) while the stored payload is decoded
+        returning False from it stops reading and raises Cancelled, an output path is then removed
+        param workers is the number of processes to decode the payload with, see parallel.py, by default it is decoded in this process
         """
+        self.__stats, self.__progress = stats, progress
+        self.__workers = checkWorkers(workers)
 
-        # load image
-        if type(image) == str: self.__image = Image.open(image)
-        elif isinstance(image, Image.Image): self.__image = image
-        else: raise ValueError(f"Parameter image should be string or Pillow image, but {type(image)} was given")
-
-        # check image color mode
-        if self.__image.mode.lower() not in ["rgb", "rgba"]:
-            raise ValueError(f"The provided image is in unsupported mode {self.__image.mode}, RGB or RGBA is needed")
+        # load image, files are decoded only as far as needed
+        self.__image = _openImage(image, stats, decode=False)
+        self.__path, self.__rowsImage = None if isinstance(image, Image.Image) else image, None
 
         # preform read
-        self.__readMetadata()
-        self.__read()
+        self.__payload = None
+        with _measure(self.__stats, "header") as counts:
+            self.__readMetadata()
+            counts["bytes"] = self.__headerLength
+        if readPayload and output is not None: self.__readToOutput(output)
+        elif readPayload: self.__read()
     
-    def __readFromPixel(self, x: int, y: int) -> int:
-        pixelData = self.__image.getpixel((x, y))
-
-        # calculate targetMod
-        tR, tG, tB = pixelData[0]%8, pixelData[1]%8, pixelData[2]%8
+    def __loadRows(self, rows: int) -> Image.Image:
+        """ Returns the image with at least its first rows decoded """
+        if self.__path is None or rows >= self.__image.height: return self.__image
+        if self.__rowsImage is not None and self.__rowsImage.height >= rows: return self.__rowsImage
+
+        # only non-interlaced PNG files can be decoded partially, other images are decoded entirely
+        image = _openRows(self.__path)
+        if image.format != "PNG" or image.info.get("interlace") or len(image.tile) != 1:
+            # a file object given by the caller is shared with the image and stays open
+            if type(self.__path) is str: image.close()
+            return self.__image
+
+        # make the decoder stop after the wanted rows
+        with _measure(self.__stats, "load") as counts:
+            decoderName, _, offset, decoderArgs = image.tile[0]
+            image.tile = [(decoderName, (0, 0, image.width, rows), offset, decoderArgs)]
+            image._size = (image.width, rows)
+            image.load()
+            counts["pixels"] = image.width*rows
+        self.__rowsImage = image
+        return image
+
+    def __readBytes(self, start: int, length: int, density: str = "standard") -> bytes:
+        """ Reads length bytes starting from pixel index start """
+        imageWidth = self.__image.width
+        image = self.__loadRows((start + -(-length // bytesPerPixel(density)) - 1) // imageWidth + 1)
 
-        # convert to binary
-        tR, tG, tB = f"{tR:03b}", f"{tG:03b}", f"{tB:02b}"
-        return int(tR+tG+tB, 2)
+        # use the array-backed codec when NumPy is available, otherwise the lookup tables
+        return createCodec(density).decode(image, start, length)
 
     def __readMetadata(self) -> None:
+        header = self.__readBytes(0, 51)
+
         # protocol version
-        protocolVersion = self.__readFromPixel(0, 0)
-        if protocolVersion != 1:
-            raise ValueError(f"Unexpected protocol version {protocolVersion}")
+        self.__protocolVersion = header[0]
+        if self.__protocolVersion not in [1, 2]:
+            raise ValueError(f"Unexpected protocol version {self.__protocolVersion}")
 
         # sha256 checksum
-        imageWidth = self.__image.width
-        self.__shaChecksum = bytes([self.__readFromPixel(i%imageWidth, i//imageWidth) for i in range(1, 33)])
+        self.__shaChecksum = header[1:33]
 
         # data type
-        dataType = bytearray([self.__readFromPixel(i%imageWidth, i//imageWidth) for i in range(33, 43)])
-        self.__dataType = dataType.lstrip(b"\0").decode("utf-8")
+        self.__dataType = header[33:43].lstrip(b"\0").decode("utf-8")
 
         # payload length
-        payloadLengthBytes = [self.__readFromPixel(i%imageWidth, i//imageWidth) for i in range(43, 51)]
-        self.__payloadLength = int.from_bytes(bytearray(payloadLengthBytes), "big")
+        self.__payloadLength = int.from_bytes(header[43:51], "big")
+
+        # options of protocol version 2
+        self.__shard, self.__headerLength = None, 51
+        self.__codec, self.__originalLength = None, self.__payloadLength
+        self.__density = "standard"
+        self.__directoryLength, self.__members = None, None
+        self.__digestChunkSize, self.__digestTable = None, None
+        if self.__protocolVersion == 2:
+            optionsLength = int.from_bytes(self.__readBytes(51, 2), "big")
+            self.__headerLength = 53 + optionsLength
+            if self.__headerLength > self.__image.width*self.__image.height:
+                raise ValueError("Header length exceeds the image size")
+            self.__readOptions(self.__readBytes(53, optionsLength))
+
+        if self.__payloadPixels()+self.__digestTablePixels()+self.__headerLength > self.__image.width*self.__image.height:
+            raise ValueError("Payload length exceeds the image size")
+        if self.__directoryLength is not None and (self.__codec is not None or self.__directoryLength > self.__payloadLength):
+            raise ValueError("Invalid container option in header")
+
+    def __payloadPixels(self) -> int:
+        """ The number of pixels the stored payload occupies """
+        return -(-self.__payloadLength // bytesPerPixel(self.__density))
+
+    def __digestTablePixels(self) -> int:
+        """ The number of pixels the digest table occupies after the payload """
+        if self.__digestChunkSize is None: return 0
+        return -(-digestTableLength(self.__payloadLength, self.__digestChunkSize) // bytesPerPixel(self.__density))
+
+    def __readOptions(self, options: bytes) -> None:
+        i = 0
+        while i < len(options):
+            if i+2 > len(options): raise ValueError("Invalid header options")
+            tag, length = options[i], options[i+1]
+            value = options[i+2:i+2+length]
+            if tag == OPTION_SHARD: self.__shard = Shard.fromBytes(value)
+            elif tag == OPTION_COMPRESSION and length == 9:
+                self.__codec, self.__originalLength = value[0], int.from_bytes(value[1:9], "big")
+                if self.__codec not in CODEC_NAMES: raise ValueError(f"Unsupported compression codec {self.__codec}")
+            elif tag == OPTION_DENSITY and length == 1:
+                if value[0] not in PROFILE_NAMES: raise ValueError(f"Unsupported density profile {value[0]}")
+                self.__density = PROFILE_NAMES[value[0]]
+                _checkDensity(self.__density, self.__image)
+            elif tag == OPTION_CONTAINER and length == 36:
+                self.__directoryLength, self.__directoryChecksum = int.from_bytes(value[0:4], "big"), bytes(value[4:36])
+            elif tag == OPTION_DIGESTS and length == 36:
+                # the digest chunks must not cross the decoded chunks
+                self.__digestChunkSize, self.__digestTableChecksum = int.from_bytes(value[0:4], "big"), bytes(value[4:36])
+                if self.__digestChunkSize == 0 or CHUNK_SIZE % self.__digestChunkSize != 0:
+                    raise ValueError("Invalid digest option in header")
+            else: raise ValueError(f"Unsupported header option {tag}")
+            i += 2 + length
+
+    def __readStoredChunks(self):
+        """
+        Yields the payload as stored in the image in chunks of at most CHUNK_SIZE bytes and verifies the checksum after the last one
+        With chunk digests, every chunk is verified before it is yielded instead
+        """
+        if self.__digestChunkSize is None:
+            return self.__verifyChunks(self.__decodeChunks(), self.__shaChecksum, "Payload corrupted")
+        return self.__readDigestedChunks()
+
+    def __readDigestedChunks(self):
+        for chunk, corruptedChunks in self.__digestChunks():
+            if len(corruptedChunks) > 0:
+                start, end = self.__digestChunkRange(corruptedChunks[0])
+                raise ValueError(f"Payload corrupted at bytes {start}-{end}")
+            yield chunk
+
+    def __digestChunkRange(self, index: int) -> tuple:
+        """ Returns the start and end byte of a digest chunk """
+        start = index*self.__digestChunkSize
+        return start, min(start + self.__digestChunkSize, self.__payloadLength)
+
+    def __loadDigestTable(self) -> bytes:
+        if self.__digestTable is None:
+            with _measure(self.__stats, "decode") as counts:
+                tableLength = digestTableLength(self.__payloadLength, self.__digestChunkSize)
+                table = self.__readBytes(self.__headerLength + self.__payloadPixels(), tableLength, self.__density)
+                counts["bytes"], counts["pixels"] = tableLength, self.__digestTablePixels()
+            if sha256(table).digest() != self.__digestTableChecksum:
+                raise ValueError("Digest table corrupted")
+            self.__digestTable = table
+        return self.__digestTable
+
+    def __digestChunks(self):
+        """ Yields the payload as stored in the image in chunks of at most CHUNK_SIZE bytes with the indices of its corrupted digest chunks """
+        table, pixelBytes = self.__loadDigestTable(), bytesPerPixel(self.__density)
+        decodedChunks, firstDigest = self.__decodeChunks(self.__digestChunkSize), 0
+        while True:
+            with _measure(self.__stats, "decode") as counts:
+                decodedChunk = next(decodedChunks, None)
+                if decodedChunk is not None: counts["bytes"], counts["pixels"] = len(decodedChunk[0]), -(-len(decodedChunk[0]) // pixelBytes)
+            if decodedChunk is None: return
+            chunk, digests = decodedChunk
+            with _measure(self.__stats, "checksum") as counts:
+                # the chunks decoded in this process are hashed here, the worker processes hash theirs
+                if digests is None: digests = chunkDigests(chunk, self.__digestChunkSize)
+                expectedDigests = tableDigests(table, firstDigest, len(digests))
+                corruptedChunks = [firstDigest+i for i in range(len(digests)) if digests[i] != expectedDigests[i]]
+                counts["bytes"] = len(chunk)
+            yield chunk, corruptedChunks
+            firstDigest += len(digests)
+
+    def __verifyChunks(self, decodedChunks, expectedChecksum: bytes, errorDescription: str):
+        """ Yields the decoded chunks and raises ValueError after the last one if their checksum does not match """
+        checksum, pixelBytes = sha256(), bytesPerPixel(self.__density)
+        while True:
+            with _measure(self.__stats, "decode") as counts:
+                chunk = next(decodedChunks, None)
+                if chunk is not None: counts["bytes"], counts["pixels"] = len(chunk), -(-len(chunk) // pixelBytes)
+            if chunk is None: break
+            with _measure(self.__stats, "checksum") as counts:
+                checksum.update(chunk)
+                counts["bytes"] = len(chunk)
+            yield chunk
+        if checksum.digest() != expectedChecksum:
+            raise ValueError(errorDescription)
+
+    def __decodeRange(self, offset: int, length: int):
+        """ Yields length bytes of the stored payload from byte offset on in chunks of at most CHUNK_SIZE bytes, decoding only their pixels """
+        if length == 0: return
+        pixelBytes = bytesPerPixel(self.__density)
+        self.__loadRows((self.__headerLength + (offset + length - 1) // pixelBytes) // self.__image.width + 1)
+        for chunkStart in range(offset, offset+length, CHUNK_SIZE):
+            # a range may start in the middle of a pixel
+            skippedLength = chunkStart % pixelBytes
+            chunkLength = min(CHUNK_SIZE, offset + length - chunkStart)
+            yield self.__readBytes(self.__headerLength + chunkStart // pixelBytes, skippedLength + chunkLength, self.__density)[skippedLength:]
+
+    def __decodeChunks(self, digestChunkSize: int = None):
+        """
+        Yields the payload as stored in the image in chunks of at most CHUNK_SIZE bytes, decoded as bands in parallel if requested
+        param digestChunkSize can be given to yield (chunk, digests) pairs, digests is None for the chunks decoded in this process
+        """
+        # decode all the payload rows at once instead of again for every chunk
+        image = self.__loadRows((self.__headerLength + self.__payloadPixels() - 1) // self.__image.width + 1)
+
+        pixelBytes = bytesPerPixel(self.__density)
+        bands = ((self.__headerLength + chunkStart // pixelBytes, min(CHUNK_SIZE, self.__payloadLength - chunkStart))
+            for chunkStart in range(0, self.__payloadLength, CHUNK_SIZE))
+        if self.__workers == 1 or self.__payloadLength <= CHUNK_SIZE:
+            for start, length in bands:
+                chunk = self.__readBytes(start, length, self.__density)
+                yield chunk if digestChunkSize is None else (chunk, None)
+            return
+        with BandPool(image, self.__workers) as bandPool:
+            yield from bandPool.decode(bands, self.__density, digestChunkSize)
+
+    def __readChunks(self):
+        """ Yields the decompressed payload in chunks of at most CHUNK_SIZE bytes """
+        storedChunks = _reportChunks(self.__progress, self.__readStoredChunks(), self.__payloadLength, "Reading")
+        if self.__codec is None: return storedChunks
+        chunks = decompressChunks(self.__codec, storedChunks, self.__originalLength, CHUNK_SIZE)
+        return _measureChunks(self.__stats, "decompress", chunks)
 
     def __read(self) -> None:
-        imageWidth = self.__image.width
-        payload = bytearray()
-        for i in range(51, self.__payloadLength+51):
-            payloadByte = self.__readFromPixel(i%imageWidth, i//imageWidth)
-            payload.append(payloadByte)
-        self.__payload = payload
-        if sha256(self.__payload).digest() != self.__shaChecksum:
-            raise ValueError("Payload corrupted")
+        if self.__codec is None:
+            # the stored length was checked against the image size, so it can be allocated at once
+            self.__payload = bytearray(self.__originalLength)
+            self.readinto(self.__payload)
+            return
+        # the original length of compressed data is not trusted for allocating, the payload grows as it is decompressed
+        self.__payload = bytearray()
+        for chunk in self.__readChunks():
+            with _measure(self.__stats, "output") as counts:
+                self.__payload += chunk
+                counts["bytes"] = len(chunk)
+
+    def __readToOutput(self, output, chunks = None) -> None:
+        """ Writes the chunks, by default the payload, to a path or a file-like object """
+        chunks = self.__readChunks() if chunks is None else chunks
+        if hasattr(output, "write"):
+            self.__writeChunks(output, chunks)
+            return
+
+        # a file with corrupted or partial payload is not left behind
+        try:
+            with open(output, "wb") as file: self.__writeChunks(file, chunks)
+        except (ValueError, Cancelled):
+            os.remove(output)
+            raise
+
+    def __writeChunks(self, file, chunks) -> None:
+        for chunk in chunks:
+            with _measure(self.__stats, "output") as counts:
+                file.write(chunk)
+                counts["bytes"] = len(chunk)
+
+    def readinto(self, buffer) -> int:
+        """
+        Decodes the payload into a writable buffer, such as bytearray, memoryview or mmap, and returns the payload length
+        Raises ValueError if the buffer is too small or the payload is corrupted
+        """
+        target = memoryview(buffer).cast("B")
+        if len(target) < self.__originalLength:
+            raise ValueError(f"Buffer of {len(target)} bytes is too small for payload of {self.__originalLength} bytes")
+        position = 0
+        for chunk in self.__readChunks():
+            with _measure(self.__stats, "output") as counts:
+                target[position:position+len(chunk)] = chunk
+                counts["bytes"] = len(chunk)
+            position += len(chunk)
+        return position
+
+    def verify(self) -> list:
+        """
+        Decodes the whole stored payload without keeping it and returns its intact byte ranges as (start, end) pairs
+        With chunk digests the corrupted chunks are located, otherwise the payload is either intact or not
+        Raises ValueError if the digest table itself is corrupted
+        """
+        if self.__digestChunkSize is None:
+            try:
+                for _ in _reportChunks(self.__progress, self.__readStoredChunks(), self.__payloadLength, "Reading"): pass
+            except ValueError: return []
+            return [(0, self.__payloadLength)]
+
+        # adjacent intact chunks are merged into one range
+        intactRanges, processedLength = [], 0
+        _reportProgress(self.__progress, processedLength, self.__payloadLength, "Reading")
+        for chunk, corruptedChunks in self.__digestChunks():
+            for index in range(processedLength // self.__digestChunkSize, -(-(processedLength + len(chunk)) // self.__digestChunkSize)):
+                if index in corruptedChunks: continue
+                start, end = self.__digestChunkRange(index)
+                if len(intactRanges) > 0 and intactRanges[-1][1] == start: intactRanges[-1] = (intactRanges[-1][0], end)
+                else: intactRanges.append((start, end))
+            processedLength += len(chunk)
+            _reportProgress(self.__progress, processedLength, self.__payloadLength, "Reading")
+        return intactRanges
+
+    def extract(self, output) -> None:
+        """ Streams the payload to a path or a writable binary file-like object, for a Reader created with readPayload=False """
+        self.__readToOutput(output)
+
+    def readMember(self, name: str, output = None) -> bytearray:
+        """
+        Reads one member of a container by decoding only the pixels of the member
+        param output can be a path or a writable binary file-like object to stream the member into, None is then returned
+        Raises ValueError if the image is not a container, the member does not exist or it is corrupted
+        """
+        members = self.members
+        if members is None:
+            raise ValueError("The image does not contain a container of members")
+        member = next((member for member in members if member.name == name), None)
+        if member is None:
+            raise ValueError(f"Member '{name}' not found")
+
+        chunks = self.__verifyChunks(self.__decodeRange(member.offset, member.length), member.checksum, f"Member '{name}' corrupted")
+        chunks = _reportChunks(self.__progress, chunks, member.length, "Reading")
+        if output is not None:
+            self.__readToOutput(output, chunks)
+            return None
+        memberBinary = bytearray()
+        for chunk in chunks:
+            with _measure(self.__stats, "output") as counts:
+                memberBinary += chunk
+                counts["bytes"] = len(chunk)
+        return memberBinary
     
+    @property
+    def stats(self) -> Stats:
+        """ The measurements of the phases of reading, or None if not requested """
+        return self.__stats
+
     @property
     def payloadBinary(self) -> bytearray:
+        """ The payload, or None if it was not read into memory """
         return self.__payload
     
     @property
     def dataType(self) -> str:
         """ The file extension of the payload """
         return self.__dataType
+
+    @property
+    def protocolVersion(self) -> int:
+        return self.__protocolVersion
+
+    @property
+    def checksum(self) -> bytes:
+        """ The sha256 checksum of the payload as stored in the image, that is after compression """
+        return self.__shaChecksum
+
+    @property
+    def payloadLength(self) -> int:
+        """ The length of the payload after decompression """
+        return self.__originalLength
+
+    @property
+    def storedLength(self) -> int:
+        """ The number of payload bytes stored in the image """
+        return self.__payloadLength
+
+    @property
+    def compression(self) -> str:
+        """ The compression codec of the payload, or "none" """
+        return CODEC_NAMES.get(self.__codec, "none")
+
+    @property
+    def freeCapacity(self) -> int:
+        """ The number of bytes left unused in the image """
+        imageCapacity = (self.__image.width*self.__image.height - self.__headerLength - self.__digestTablePixels()) * bytesPerPixel(self.__density)
+        return imageCapacity - self.__payloadLength
+
+    @property
+    def density(self) -> str:
+        """ The density profile of the payload, see codec.PROFILES """
+        return self.__density
+
+    @property
+    def shard(self) -> Shard:
+        """ The position of the payload within a payload split across several images, or None """
+        return self.__shard
+
+    @property
+    def digestChunkSize(self) -> int:
+        """ The number of stored payload bytes per chunk digest, or None if the payload has no chunk digests """
+        return self.__digestChunkSize
+
+    @property
+    def members(self) -> list:
+        """ The members of a container as a list of Member, or None if the payload is not a container """
+        if self.__directoryLength is None: return None
+        if self.__members is None:
+            chunks = self.__verifyChunks(self.__decodeRange(0, self.__directoryLength), self.__directoryChecksum, "Container directory corrupted")
+            members = _unpackDirectory(b"".join(chunks))
+            for member in members:
+                if member.offset < self.__directoryLength or member.offset + member.length > self.__payloadLength:
+                    raise ValueError("Invalid container directory")
+            self.__members = members
+        return list(self.__members)
+
+
+def probe(image) -> dict:
+    """
+    Reads only the header of the image, and the directory of a container, without touching the other payload pixels
+    param image should be string (path to file), a seekable binary file-like object or PIL.Image.Image
+    """
+    reader = Reader(image, readPayload=False)
+    info = {
+        "version": reader.protocolVersion,
+        "checksum": reader.checksum.hex(),
+        "dataType": reader.dataType,
+        "payloadLength": reader.payloadLength,
+        "storedLength": reader.storedLength,
+        "compression": reader.compression,
+        "density": reader.density,
+        "freeCapacity": reader.freeCapacity
+    }
+    if reader.shard is not None:
+        info["shard"] = {**reader.shard._asdict(), "checksum": reader.shard.checksum.hex()}
+    if reader.digestChunkSize is not None:
+        info["digestChunkSize"] = reader.digestChunkSize
+    if reader.members is not None:
+        # only the pixels of the directory are decoded
+        info["members"] = [{**member._asdict(), "checksum": member.checksum.hex()} for member in reader.members]
+    return info
@@ -0,0 +1,112 @@
+"""
+
+imgwriter / parallel.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+from PIL import Image
+from codec import createCodec
+from digests import chunkDigests
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+
+# number of rows copied between the image and the shared memory at once, to avoid a second copy of the whole image
+COPY_ROWS = 256
+
+# shared memory and the number of channels of the image, set in every worker process
+_sharedPixels = None
+
+
+def _initWorker(name: str, bands: int) -> None:
+    global _sharedPixels
+    _sharedPixels = (shared_memory.SharedMemory(name), bands)
+
+def _encodeBand(start: int, message: bytes, density: str) -> None:
+    memory, bands = _sharedPixels
+    createCodec(density).encodeBuffer(memory.buf, bands, start, message)
+
+def _decodeBand(start: int, length: int, density: str, digestChunkSize: int):
+    memory, bands = _sharedPixels
+    message = createCodec(density).decodeBuffer(memory.buf, bands, start, length)
+    if digestChunkSize is None: return message
+    return message, chunkDigests(message, digestChunkSize)
+
+
+class BandPool:
+    def __init__(self, image: Image.Image, workers: int) -> None:
+        """
+        Encodes and decodes bands of the pixel span in worker processes that share the raw pixel data of the image,
+        so that only the message bytes are sent between the processes
+        Use in a with statement, the modified pixels are copied back to the image when the block exits without errors
+        param workers is the number of worker processes
+        """
+        self.__image, self.__bands = image, len(image.getbands())
+        self.__rowLength = image.width*self.__bands
+        self.__memory = shared_memory.SharedMemory(create=True, size=max(1, self.__rowLength*image.height))
+        self.__pending = deque()
+        self.__maxPending = 2*workers
+        self.__modifiedRows = None      # (first, last) row written to
+        try:
+            for top in range(0, image.height, COPY_ROWS):
+                rows = image.crop((0, top, image.width, min(image.height, top+COPY_ROWS))).tobytes()
+                self.__memory.buf[top*self.__rowLength:top*self.__rowLength+len(rows)] = rows
+            self.__executor = ProcessPoolExecutor(max_workers=workers, initializer=_initWorker, initargs=(self.__memory.name, self.__bands))
+        except BaseException:
+            self.__releaseMemory()
+            raise
+
+    def __enter__(self) -> "BandPool":
+        return self
+
+    def __exit__(self, errorType, error, traceback) -> None:
+        try:
+            if errorType is None:
+                while len(self.__pending) > 0: self.__pending.popleft().result()
+                self.__copyBack()
+        finally:
+            self.__executor.shutdown(wait=True, cancel_futures=True)
+            self.__pending.clear()
+            self.__releaseMemory()
+
+    def __releaseMemory(self) -> None:
+        self.__memory.close()
+        self.__memory.unlink()
+
+    def __copyBack(self) -> None:
+        if self.__modifiedRows is None: return
+        firstRow, lastRow = self.__modifiedRows
+        for top in range(firstRow, lastRow+1, COPY_ROWS):
+            bottom = min(lastRow+1, top+COPY_ROWS)
+            rows = bytes(self.__memory.buf[top*self.__rowLength:bottom*self.__rowLength])
+            self.__image.paste(Image.frombytes(self.__image.mode, (self.__image.width, bottom-top), rows), (0, top))
+
+    def encode(self, start: int, message: bytes, density: str, pixelCount: int) -> None:
+        """
+        Writes the message into pixelCount pixels starting from pixel index start in a worker process
+        Blocks while too many bands are waiting, and raises the error of a failed band
+        """
+        firstRow, lastRow = start // self.__image.width, (start + pixelCount - 1) // self.__image.width
+        if self.__modifiedRows is not None:
+            firstRow, lastRow = min(firstRow, self.__modifiedRows[0]), max(lastRow, self.__modifiedRows[1])
+        self.__modifiedRows = (firstRow, lastRow)
+
+        self.__pending.append(self.__executor.submit(_encodeBand, start, bytes(message), density))
+        while len(self.__pending) > self.__maxPending: self.__pending.popleft().result()
+
+    def decode(self, bands, density: str, digestChunkSize: int = None):
+        """
+        Yields the messages of the bands in order
+        param bands should be an iterable of (start, length) pairs, a few bands are decoded ahead in the workers
+        param digestChunkSize can be given to yield (message, digests) pairs instead, see digests.chunkDigests
+        the workers then also hash the messages in parallel
+        """
+        pending = deque()
+        for start, length in bands:
+            pending.append(self.__executor.submit(_decodeBand, start, length, density, digestChunkSize))
+            if len(pending) > self.__maxPending: yield pending.popleft().result()
+        while len(pending) > 0: yield pending.popleft().result()
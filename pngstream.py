@@ -0,0 +1,200 @@
+"""
+
+imgwriter / pngstream.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+from main import Writer, CHUNK_SIZE
+from codec import bytesPerPixel
+from digests import DIGEST_CHUNK_SIZE, digestTableLength
+from PIL import Image
+from contextlib import ExitStack, nullcontext
+import io
+import os
+import struct
+import zlib
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+# the longest possible header with every option, so that the rows holding the data are known before writing
+MAX_HEADER_LENGTH = 53 + 256
+# the written image data is split into IDAT chunks of this many bytes
+IDAT_SIZE = 256*1024
+
+
+def _readChunks(file):
+    """ Yields the type and data of every chunk after the signature """
+    while True:
+        lengthAndType = file.read(8)
+        if len(lengthAndType) == 0: return
+        if len(lengthAndType) < 8: raise ValueError("PNG file is truncated")
+        length, chunkType = struct.unpack(">I4s", lengthAndType)
+        data = file.read(length)
+        crc = file.read(4)
+        if len(data) < length or len(crc) < 4: raise ValueError("PNG file is truncated")
+        if zlib.crc32(chunkType + data) != struct.unpack(">I", crc)[0]:
+            raise ValueError(f"PNG chunk {chunkType.decode('latin-1')} is corrupted")
+        yield chunkType, data
+        if chunkType == b"IEND": return
+
+def _writeChunk(file, chunkType: bytes, data) -> None:
+    file.write(struct.pack(">I", len(data)) + chunkType)
+    file.write(data)
+    file.write(struct.pack(">I", zlib.crc32(data, zlib.crc32(chunkType))))
+
+def _inflate(firstData: bytes, chunks, trailingChunks: list):
+    """ Yields the decompressed image data of the consecutive IDAT chunks, the first chunk after them is added to trailingChunks """
+    decompressor = zlib.decompressobj()
+    data = firstData
+    while True:
+        # the output is limited so that highly compressed rows do not expand at once
+        while len(data) > 0:
+            yield decompressor.decompress(data, CHUNK_SIZE)
+            data = decompressor.unconsumed_tail
+        chunkType, data = next(chunks, (None, b""))
+        if chunkType != b"IDAT":
+            if chunkType is not None: trailingChunks.append((chunkType, data))
+            yield decompressor.flush()
+            return
+
+def _unfilterRows(filteredRows: bytes, width: int, rowCount: int, colorType: int) -> Image.Image:
+    """ Undoes the PNG filters of the top rows with the decoder of Pillow, by wrapping them into a PNG file of their own """
+    file = io.BytesIO()
+    file.write(PNG_SIGNATURE)
+    _writeChunk(file, b"IHDR", struct.pack(">IIBBBBB", width, rowCount, 8, colorType, 0, 0, 0))
+    # the rows are stored without compressing them again, which is the fastest way to hand them over
+    _writeChunk(file, b"IDAT", zlib.compress(filteredRows, 0))
+    _writeChunk(file, b"IEND", b"")
+    file.seek(0)
+    image = Image.open(file)
+    image.load()
+    return image
+
+def _measurePayload(payload) -> tuple:
+    """ Returns the payload and its length, payloads of unknown length are read into memory """
+    if type(payload) is bytes: return payload, len(payload)
+    if isinstance(payload, os.PathLike): return payload, os.path.getsize(payload)
+    if type(payload) is dict:
+        # the directory of a container, see main.Writer
+        members, length = {}, 4
+        for name, member in payload.items():
+            members[name], memberLength = _measurePayload(member)
+            length += 2 + len(str(name).encode("utf-8")) + 48 + memberLength
+        return members, length
+    try:
+        position = payload.tell()
+        length = payload.seek(0, os.SEEK_END) - position
+        payload.seek(position)
+        return payload, length
+    except (AttributeError, OSError):
+        payload = payload.read()
+        return payload, len(payload)
+
+def _messageRows(payloadLength: int, width: int, height: int, options: dict) -> int:
+    """ Returns the number of rows from the top that can hold the header and the payload """
+    storedLength = payloadLength
+    if options.get("compression") not in [None, "none"]:
+        # the codecs expand incompressible data only a little
+        storedLength += payloadLength // 100 + 1024
+    if options.get("digests") == True: storedLength += digestTableLength(storedLength, DIGEST_CHUNK_SIZE)
+    pixelBytes = bytesPerPixel(options.get("density", "standard"))
+    messagePixels = MAX_HEADER_LENGTH + -(-storedLength // pixelBytes) + (pixelBytes if options.get("digests") == True else 0)
+    return min(height, -(-messagePixels // width))
+
+
+class _StreamWriter:
+    def __init__(self, source, output, payload, dataType: str, compressLevel: int, options: dict) -> None:
+        self.__stats = options.get("stats")
+        self.__compressor = zlib.compressobj(compressLevel)
+        self.__output, self.__idatBuffer = output, bytearray()
+
+        if source.read(8) != PNG_SIGNATURE: raise ValueError("The provided image is not a PNG file")
+        chunks = _readChunks(source)
+        chunkType, ihdr = next(chunks, (None, b""))
+        if chunkType != b"IHDR" or len(ihdr) != 13: raise ValueError("PNG file has no valid IHDR chunk")
+        width, height, bitDepth, colorType, _, _, interlace = struct.unpack(">IIBBBBB", ihdr)
+        if bitDepth != 8 or colorType not in [2, 6] or interlace != 0:
+            raise ValueError("Only non-interlaced 8-bit RGB and RGBA PNG files can be streamed")
+        self.__rowLength = width*(3 if colorType == 2 else 4)
+
+        # the chunks before the image data are copied as they are
+        output.write(PNG_SIGNATURE)
+        _writeChunk(output, b"IHDR", ihdr)
+        for chunkType, data in chunks:
+            if chunkType == b"IDAT": break
+            _writeChunk(output, chunkType, data)
+        else: raise ValueError("PNG file has no image data")
+
+        # decode only the rows that hold the data, and the row after them that refers to them with its filter
+        payload, payloadLength = _measurePayload(payload)
+        messageRows = _messageRows(payloadLength, width, height, options)
+        trailingChunks = []
+        self.__pieces = _inflate(data, chunks, trailingChunks)
+        self.__buffer = bytearray()
+        with self.__measure("load") as counts:
+            decodedRows = min(height, messageRows + 1)
+            decodedImage = _unfilterRows(b"".join(self.__takeRow() for _ in range(decodedRows)), width, decodedRows, colorType)
+            counts["pixels"] = width*decodedRows
+        messageImage = decodedImage.crop((0, 0, width, messageRows))
+        nextRow = decodedImage.crop((0, messageRows, width, decodedRows)).tobytes()
+        del decodedImage
+        Writer(messageImage, payload, dataType, **options)
+
+        with self.__measure("save") as counts:
+            # the decoded rows are written without a filter, so the rows after them can be copied as they are
+            messageBytes = memoryview(messageImage.tobytes())
+            for i in range(messageRows): self.__compress(b"\0" + messageBytes[i*self.__rowLength:(i+1)*self.__rowLength])
+            if len(nextRow) > 0: self.__compress(b"\0" + nextRow)
+            self.__compress(self.__buffer)
+            for piece in self.__pieces: self.__compress(piece)
+            self.__compress(self.__compressor.flush(), flush=True)
+            for chunkType, data in trailingChunks + list(chunks):
+                _writeChunk(output, chunkType, data)
+            counts["pixels"] = width*height
+
+    def __measure(self, phase: str):
+        return nullcontext({}) if self.__stats is None else self.__stats.measure(phase)
+
+    def __takeRow(self) -> bytearray:
+        """ Returns the next filtered row with its filter type byte """
+        while len(self.__buffer) < self.__rowLength + 1:
+            piece = next(self.__pieces, None)
+            if piece is None: raise ValueError("PNG image data is truncated")
+            self.__buffer += piece
+        row = self.__buffer[:self.__rowLength+1]
+        del self.__buffer[:self.__rowLength+1]
+        return row
+
+    def __compress(self, data, flush: bool = False) -> None:
+        self.__idatBuffer += data if flush else self.__compressor.compress(data)
+        while len(self.__idatBuffer) >= IDAT_SIZE or (flush and len(self.__idatBuffer) > 0):
+            _writeChunk(self.__output, b"IDAT", self.__idatBuffer[:IDAT_SIZE])
+            del self.__idatBuffer[:IDAT_SIZE]
+
+
+def writeStream(source, output, payload, dataType: str, compressLevel: int = 6, **options) -> None:
+    """
+    Writes the payload like Writer followed by Writer.save, but decodes and encodes the PNG file row by row
+    Only the rows holding the data are kept in memory, so images of any size can be used, including those over Image.MAX_IMAGE_PIXELS
+    param source and output can be paths or binary file-like objects, output can also be a pipe
+    param compressLevel is the zlib compression level of the written image data
+    param options are the parameters of Writer
+    Only non-interlaced 8-bit RGB and RGBA PNG files are supported, other chunks are kept as they are
+    """
+    if type(compressLevel) is not int or not 0 <= compressLevel <= 9:
+        raise ValueError(f"Parameter compressLevel should be an integer from 0 to 9, but {compressLevel!r} was given")
+    with ExitStack() as files:
+        sourceFile = files.enter_context(open(source, "rb")) if not hasattr(source, "read") else source
+        if hasattr(output, "write"):
+            _StreamWriter(sourceFile, output, payload, dataType, compressLevel, options)
+            return
+
+        # a partially written image is not left behind
+        try:
+            with open(output, "wb") as outputFile: _StreamWriter(sourceFile, outputFile, payload, dataType, compressLevel, options)
+        except BaseException:
+            if os.path.exists(output): os.remove(output)
+            raise
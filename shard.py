@@ -0,0 +1,190 @@
+"""
+
+imgwriter / shard.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+from PIL import Image
+from main import Reader, Writer, Shard, CHUNK_SIZE
+from concurrent.futures import ProcessPoolExecutor
+from hashlib import sha256
+import os
+
+# header length of an image holding a shard: 53 bytes of protocol version 2 and the shard option with its tag and length
+SHARD_HEADER_LENGTH = 53 + 2 + 52
+
+
+def carrierCapacity(carrier: str) -> int:
+    """ Returns the number of payload bytes that fit in the carrier as a shard, without decoding the image """
+    with Image.open(carrier) as image:
+        return max(0, image.width*image.height - SHARD_HEADER_LENGTH)
+
+def selectCarriers(carriers: list, payloadLength: int) -> list:
+    """
+    Picks the fewest carriers from the pool that together can hold payloadLength bytes
+    param carriers should be a list of image paths
+    """
+    capacities = sorted(((carrierCapacity(carrier), carrier) for carrier in carriers), key=lambda item: item[0], reverse=True)
+    selected, totalCapacity = [], 0
+    for capacity, carrier in capacities:
+        if totalCapacity >= payloadLength and len(selected) > 0: break
+        selected.append(carrier)
+        totalCapacity += capacity
+    if totalCapacity < payloadLength:
+        raise ValueError("The provided images are too small")
+    return selected
+
+def _writeShard(carrier: str, output: str, payload, length: int, dataType: str, shard: Shard, addExif: bool) -> None:
+    # payload is either the bytes of the shard or the path of the whole payload file
+    if isinstance(payload, os.PathLike):
+        with open(payload, "rb") as file:
+            file.seek(shard.offset)
+            payload = file.read(length)
+    Writer(carrier, payload, dataType, shard).save(output, addExif)
+
+def _readShard(image: str, output: str) -> tuple:
+    reader = Reader(image, readPayload=False)
+    if reader.shard is None:
+        raise ValueError(f"Image '{image}' does not contain a shard")
+    if output is None:
+        return reader.shard, reader.dataType, bytes(Reader(image).payloadBinary)
+
+    # write the shard straight to its place in the output file
+    with open(output, "r+b") as file:
+        file.seek(reader.shard.offset)
+        Reader(image, output=file)
+    return reader.shard, reader.dataType, None
+
+
+class ShardWriter:
+    def __init__(self, carriers: list, payload, dataType: str, outputs: list, addExif: bool = False, workers: int = None) -> None:
+        """
+        Splits the payload across the carriers in proportion to their capacities and saves them in parallel
+        param carriers should be a list of image paths, see selectCarriers
+        param payload should be bytes or a path-like object
+        param outputs should be a list of paths for the resulting images, one per carrier
+        param workers is the number of worker processes, by default the number of CPUs
+        """
+        if len(carriers) != len(outputs):
+            raise ValueError("There should be exactly one output path per carrier")
+        if len(carriers) == 0 or len(carriers) > 0xffff:
+            raise ValueError(f"Payload cannot be split across {len(carriers)} images")
+        if type(payload) is not bytes and not isinstance(payload, os.PathLike):
+            raise ValueError(f"Parameter payload should be bytes or path, but {type(payload)} was given")
+
+        # the whole payload is hashed before splitting
+        payloadLength, checksum = self.__measurePayload(payload)
+        lengths = self.__splitPayload([carrierCapacity(carrier) for carrier in carriers], payloadLength)
+
+        # every worker writes one shard
+        self.__shards, offset = [], 0
+        for index, length in enumerate(lengths):
+            self.__shards.append(Shard(index, len(carriers), offset, payloadLength, checksum))
+            offset += length
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = []
+            for carrier, output, shard, length in zip(carriers, outputs, self.__shards, lengths):
+                shardPayload = payload[shard.offset:shard.offset+length] if type(payload) is bytes else payload
+                futures.append(executor.submit(_writeShard, carrier, output, shardPayload, length, dataType, shard, addExif))
+            for future in futures: future.result()
+        self.__lengths = lengths
+
+    def __measurePayload(self, payload) -> tuple:
+        if type(payload) is bytes: return len(payload), sha256(payload).digest()
+        checksum, payloadLength = sha256(), 0
+        with open(payload, "rb") as file:
+            while chunk := file.read(CHUNK_SIZE):
+                checksum.update(chunk)
+                payloadLength += len(chunk)
+        return payloadLength, checksum.digest()
+
+    def __splitPayload(self, capacities: list, payloadLength: int) -> list:
+        """ Returns the shard lengths in proportion to the capacities """
+        totalCapacity = sum(capacities)
+        if payloadLength > totalCapacity:
+            raise ValueError("The provided images are too small")
+        lengths = [payloadLength*capacity // totalCapacity for capacity in capacities]
+
+        # distribute the rounding remainder to carriers that still have room
+        remainder = payloadLength - sum(lengths)
+        for i, capacity in enumerate(capacities):
+            extra = min(remainder, capacity - lengths[i])
+            lengths[i] += extra
+            remainder -= extra
+        return lengths
+
+    @property
+    def shards(self) -> list:
+        """ The shards written to the images, in the order of the carriers """
+        return self.__shards
+
+    @property
+    def shardLengths(self) -> list:
+        """ The number of payload bytes written to each image """
+        return self.__lengths
+
+
+class ShardReader:
+    def __init__(self, images: list, output = None, workers: int = None) -> None:
+        """
+        Reads the shards from the images in parallel and reassembles the payload
+        param images should be a list of image paths in any order
+        param output can be a path to write the payload to instead of memory
+        param workers is the number of worker processes, by default the number of CPUs
+        """
+        if len(images) == 0:
+            raise ValueError("At least one image is needed")
+        self.__payload = None
+
+        if output is None:
+            results = self.__readShards(images, None, workers)
+            payload = bytearray()
+            for _, _, shardPayload in sorted(results, key=lambda result: result[0].index):
+                payload += shardPayload
+            self.__verify(results, len(payload), sha256(payload).digest())
+            self.__payload = payload
+            return
+
+        # workers write their shards straight to the output file
+        try:
+            with open(output, "wb"): pass
+            results = self.__readShards(images, output, workers)
+            checksum, payloadLength = sha256(), 0
+            with open(output, "rb") as file:
+                while chunk := file.read(CHUNK_SIZE):
+                    checksum.update(chunk)
+                    payloadLength += len(chunk)
+            self.__verify(results, payloadLength, checksum.digest())
+        except Exception:
+            if os.path.exists(output): os.remove(output)
+            raise
+
+    def __readShards(self, images: list, output: str, workers: int) -> list:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(_readShard, image, output) for image in images]
+            return [future.result() for future in futures]
+
+    def __verify(self, results: list, payloadLength: int, checksum: bytes) -> None:
+        """ Checks that all the shards of the same payload are present and the payload is intact """
+        shards = [shard for shard, _, _ in results]
+        self.__dataType = results[0][1]
+        if any(shard.count != shards[0].count or shard.checksum != shards[0].checksum for shard in shards):
+            raise ValueError("The images contain shards of different payloads")
+        if sorted(shard.index for shard in shards) != list(range(shards[0].count)):
+            raise ValueError(f"Expected shards 0...{shards[0].count-1}, but got {sorted(shard.index for shard in shards)}")
+        if payloadLength != shards[0].payloadLength or checksum != shards[0].checksum:
+            raise ValueError("Payload corrupted")
+
+    @property
+    def payloadBinary(self) -> bytearray:
+        """ The reassembled payload, or None if it was written to output """
+        return self.__payload
+
+    @property
+    def dataType(self) -> str:
+        """ The file extension of the payload """
+        return self.__dataType
@@ -0,0 +1,12 @@
+"""
+
+imgwriter / version.py
+Copyright (c) 2022 Pyry Lahtinen
+MIT license (read more on LICENSE.txt)
+https://github.com/PyryL/imgwriter
+File created on 2026-10-17
+
+"""
+
+# kept apart from main so that printing the version does not import Pillow
+__version__ = "1.0.1"